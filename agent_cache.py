@@ -0,0 +1,67 @@
+# 舊版入口（main_free_input.py / main_with_methods.py）的 agent 快取
+# 原本每次 rerun 都在模組層級重新建立全部 agent，每個都要重新檢查 llm_config、建立 OpenAI client。
+# 這裡依 (model, base_url, temperature) 把建好的整組 agent 留在 process 裡，跨 rerun、跨 session 重複使用。
+#
+# agent 會記住跟對方的對話（_oai_messages），兩個 session 同時拿同一組 agent 聊天會互相干擾，
+# 所以是「借出 / 歸還」：同一時間一組 agent 只給一個 session 用，都被借走時才再建一組新的。
+import threading
+import time
+from contextlib import contextmanager
+
+
+# 每種設定最多留幾組閒置的 agent（同時在討論的人數超過時，多建的用完就丟掉）
+MAX_IDLE_PER_KEY = 4
+
+
+class AgentCache:
+    def __init__(self, max_idle_per_key=MAX_IDLE_PER_KEY):
+        self.max_idle_per_key = max_idle_per_key
+        self._idle = {}  # {key: [agent_set, ...]}
+        self._lock = threading.Lock()
+        self._built = 0
+        self._reused = 0
+        self._build_seconds = 0.0
+
+    @contextmanager
+    def checkout(self, key, build):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            agent_set = idle.pop() if idle else None
+            if agent_set is not None:
+                self._reused += 1
+
+        if agent_set is None:
+            start = time.perf_counter()
+            agent_set = build()
+            with self._lock:
+                self._built += 1
+                self._build_seconds += time.perf_counter() - start
+
+        try:
+            yield agent_set
+        finally:
+            with self._lock:
+                idle = self._idle.setdefault(key, [])
+                if len(idle) < self.max_idle_per_key:
+                    idle.append(agent_set)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "built": self._built,
+                "reused": self._reused,
+                "build_seconds": self._build_seconds,
+                "idle": sum(len(idle) for idle in self._idle.values()),
+            }
+
+
+_agent_cache = None
+_agent_cache_lock = threading.Lock()
+
+
+def get_agent_cache():
+    global _agent_cache
+    with _agent_cache_lock:
+        if _agent_cache is None:
+            _agent_cache = AgentCache()
+        return _agent_cache
@@ -0,0 +1,120 @@
+# 靜態圖片處理
+# 說明視窗的截圖和頭像原本每次都讀 PNG/GIF 再轉成 base64 data URI 塞進網頁（比原檔多約 1/3，collect.gif 將近 4 MB）。
+# 這裡事先縮圖、轉成 WebP 放到 static/，透過 Streamlit 的 static file serving 提供；
+# 網址帶 ?v=<內容雜湊>，Tornado 看到 v 參數會回傳長效的 Cache-Control，內容改了網址也會跟著變。
+# 頭像例外：st.chat_message（streamlit 1.39）只接受 http(s) 網址或圖片本身，不是 PNG 就會每次重新編碼，
+# 所以頭像縮成帶透明度的 PNG，直接把檔案內容交給它（格式相同時 Streamlit 原樣送出）。
+#
+# 重新產生：
+#   python assets.py
+import hashlib
+import json
+import os
+import threading
+
+from PIL import Image, ImageSequence
+
+
+STATIC_DIR = "static"
+MANIFEST_PATH = os.path.join(STATIC_DIR, "manifest.json")
+
+# 說明視窗的截圖：寬度上限（原本以 max-width:70% 顯示在大對話框裡）
+ONBOARDING_IMAGES = [
+    "personas_main_ui.png",
+    "personas_intro.png",
+    "persona_ai_feedback.png",
+    "no_personas_main_ui.png",
+    "no_personas_intro.png",
+    "no_persona_ai_feedback.png",
+    "collect.gif",
+    "free_text.png",
+    "scamper.png",
+]
+ONBOARDING_MAX_WIDTH = 1200
+# 動畫每隔幾幀取一幀；collect.gif 是 30ms 一幀的螢幕錄影，每 3 幀取 1 幀仍然流暢
+ANIMATION_FRAME_STEP = 3
+ANIMATION_MAX_WIDTH = 800
+# 關鍵幀間隔拉長、允許有損/無損混合，讓大部分幀只存跟前一幀的差異（螢幕錄影大多是靜止畫面）
+ANIMATION_MAX_KEYFRAME_INTERVAL = 200
+
+AVATAR_IMAGES = ["businessman.png", "engineer.png", "agent_a.png", "agent_b.png"]
+AVATAR_SIZE = 128
+
+_manifest = None
+_avatars = {}
+_assets_lock = threading.Lock()
+
+
+def _resized(image, max_width):
+    if image.width <= max_width:
+        return image
+    return image.resize((max_width, round(image.height * max_width / image.width)), Image.LANCZOS)
+
+
+def _convert(source, target, max_width):
+    with Image.open(source) as image:
+        if getattr(image, "n_frames", 1) > 1:
+            frames = []
+            durations = []
+            for i, frame in enumerate(ImageSequence.Iterator(image)):
+                if i % ANIMATION_FRAME_STEP:
+                    continue
+                frames.append(_resized(frame.convert("RGB"), min(max_width, ANIMATION_MAX_WIDTH)))
+                durations.append(frame.info.get("duration", 100) * ANIMATION_FRAME_STEP)
+            frames[0].save(target, "WEBP", save_all=True, append_images=frames[1:], duration=durations, loop=0,
+                           quality=50, method=4, allow_mixed=True, kmax=ANIMATION_MAX_KEYFRAME_INTERVAL)
+        elif target.endswith(".png"):
+            _resized(image.convert("RGBA"), max_width).save(target, "PNG", optimize=True)
+        else:
+            _resized(image.convert("RGBA"), max_width).save(target, "WEBP", quality=85, method=6)
+
+
+def build_assets():
+    os.makedirs(STATIC_DIR, exist_ok=True)
+    manifest = {}
+    for name, max_width in [(n, ONBOARDING_MAX_WIDTH) for n in ONBOARDING_IMAGES] + [(n, AVATAR_SIZE) for n in AVATAR_IMAGES]:
+        target_name = os.path.splitext(name)[0] + (".png" if name in AVATAR_IMAGES else ".webp")
+        target = os.path.join(STATIC_DIR, target_name)
+        _convert(name, target, max_width)
+        with open(target, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:12]
+        manifest[name] = {"file": target_name, "hash": digest}
+        print(f"{name} ({os.path.getsize(name) // 1024} KB) → {target} ({os.path.getsize(target) // 1024} KB)")
+
+    with open(MANIFEST_PATH, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+
+def _load_manifest():
+    # 整個 process 只讀一次；還沒產生過就回傳空的，呼叫端改用原始圖片
+    global _manifest
+    with _assets_lock:
+        if _manifest is None:
+            try:
+                with open(MANIFEST_PATH, encoding="utf-8") as f:
+                    _manifest = json.load(f)
+            except FileNotFoundError:
+                _manifest = {}
+        return _manifest
+
+
+def asset_url(name):
+    entry = _load_manifest().get(name)
+    if entry is None:
+        return None
+    return f"app/static/{entry['file']}?v={entry['hash']}"
+
+
+def avatar_image(name):
+    # 頭像每次 rerun 都會用到，縮好的 PNG 在整個 process 只讀一次（還沒產生就用原始圖片）
+    entry = _load_manifest().get(name)
+    path = os.path.join(STATIC_DIR, entry["file"]) if entry else name
+    with _assets_lock:
+        if path not in _avatars:
+            with open(path, "rb") as f:
+                _avatars[path] = f.read()
+        return _avatars[path]
+
+
+if __name__ == "__main__":
+    build_assets()
@@ -0,0 +1,91 @@
+# 聊天紀錄的 HTML 快取
+# 每次 rerun 都會重播整段對話紀錄；每則訊息切句 + markdown 轉 HTML 的結果只算一次，
+# 以內容雜湊為 key 存在 process 層級（不同 session 的相同內容也共用），並合成單一 element 輸出。
+import hashlib
+import threading
+from collections import OrderedDict
+
+import markdown2
+
+from text_processing import smart_sentence_split
+
+
+MAX_CACHED_MESSAGES = 5000
+
+# 淡入效果：每句間隔幾秒、最多幾句有各自的延遲（之後的句子跟最後一句同時出現）
+FADE_IN_DELAY_SECONDS = 0.4
+FADE_IN_MAX_SENTENCES = 40
+
+# 整頁只注入一次的樣式：說明視窗大小、使用者訊息泡泡、逐句淡入
+PAGE_STYLESHEET = (
+    "<style>"
+    "div[data-testid='stDialog'] div[role='dialog']:has(.big-dialog){width:80vw;max-height:95vh;overflow-y:auto;}"
+    ".user-bubble-row{display:flex;justify-content:flex-end;margin:10px 0;}"
+    ".user-bubble{background-color:#DCF8C6;padding:12px 16px;border-radius:18px;max-width:50%;text-align:left;"
+    "box-shadow:1px 1px 5px rgba(0,0,0,0.1);white-space:normal;}"
+    ".fade-in>div{opacity:0;animation:fadeInAnim 0.6s ease forwards;}"
+    + "".join(
+        f".fade-in>div:nth-child({i + 1}){{animation-delay:{i * FADE_IN_DELAY_SECONDS:.1f}s;}}"
+        for i in range(1, FADE_IN_MAX_SENTENCES)
+    )
+    + f".fade-in>div:nth-child(n+{FADE_IN_MAX_SENTENCES + 1}){{animation-delay:{(FADE_IN_MAX_SENTENCES - 1) * FADE_IN_DELAY_SECONDS:.1f}s;}}"
+    "@keyframes fadeInAnim{to{opacity:1;}}"
+    "</style>"
+)
+
+_html_cache = OrderedDict()
+_html_cache_lock = threading.Lock()
+
+
+def _cached(kind, content, render):
+    key = hashlib.sha256(f"{kind}\0{content}".encode("utf-8")).hexdigest()
+    with _html_cache_lock:
+        if key in _html_cache:
+            _html_cache.move_to_end(key)
+            return _html_cache[key]
+
+    html = render(content)
+    with _html_cache_lock:
+        _html_cache[key] = html
+        if len(_html_cache) > MAX_CACHED_MESSAGES:
+            _html_cache.popitem(last=False)
+    return html
+
+
+def _render_sentences(content):
+    # 原本每句各用一個 st.markdown 輸出，這裡每句包成一個 div 再合成一段 HTML
+    # （HTML 內不能有空行，否則 markdown 會把後面的內容當成一般文字；換行換成空白，折行的兩行才不會黏在一起）
+    return "".join(
+        f"<div>{markdown2.markdown(sentence).strip().replace(chr(10), ' ')}</div>"
+        for sentence in smart_sentence_split(content)
+    )
+
+
+def _render_user_bubble(content):
+    # 樣式都在 PAGE_STYLESHEET 的 .user-bubble 裡，每則訊息只送 class 名稱
+    html_content = markdown2.markdown(content).strip().replace("\n", " ")  # 解析 Markdown 為 HTML
+    return f"<div class='user-bubble-row'><div class='user-bubble'>{html_content}</div></div>"
+
+
+def sentences_html(content):
+    return _cached("sentences", content, _render_sentences)
+
+
+def user_bubble_html(content):
+    return _cached("user", content, _render_user_bubble)
+
+
+def group_messages_by_round(messages):
+    # 每一輪都以使用者送出的輸入（role 為 "user"）結尾，用它切出各輪（還原的舊紀錄沒有輪次欄位，也能這樣分）；
+    # 進行中的這一輪還沒有使用者輸入，會是最後一組
+    rounds = [[]]
+    for message in messages:
+        rounds[-1].append(message)
+        if message["role"] == "user":
+            rounds.append([])
+    return [round_messages for round_messages in rounds if round_messages]
+
+
+def fadein_html(content):
+    # 一句一句淡入：延遲由 PAGE_STYLESHEET 的 nth-child 規則決定，這裡只輸出句子本身
+    return f"<div class='fade-in'>{_render_sentences(content)}</div>"
@@ -0,0 +1 @@
+# 讓 tests/ 可以直接 import 專案根目錄的模組
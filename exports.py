@@ -0,0 +1,57 @@
+# 收藏 Idea 與完整對話紀錄的匯出檔
+# 只在使用者按下「準備匯出檔」時才產生，結果放在 session_cache，收藏內容或對話沒變就沿用。
+import io
+
+import pandas as pd
+
+from chat_render import group_messages_by_round
+
+
+EXPORT_FORMATS = {
+    "收藏的 Ideas（CSV）": {"extension": "csv", "mime": "text/csv"},
+    "收藏的 Ideas（XLSX）": {"extension": "xlsx", "mime": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"},
+    "完整對話紀錄（Markdown）": {"extension": "md", "mime": "text/markdown"},
+}
+
+
+def collected_ideas_frame(discussion_topic, ideas):
+    # ideas: [(去掉 Markdown 的 Idea, 收藏輪數)]
+    return pd.DataFrame([
+        {
+            "討論題目": discussion_topic,
+            "Idea": idea,
+            "收藏輪數": round_collected
+        }
+        for idea, round_collected in ideas
+    ])
+
+
+def ideas_csv_bytes(df):
+    # 加入 UTF-8 BOM（\ufeff）確保 Excel 不會亂碼
+    csv_buffer = io.StringIO()
+    df.to_csv(csv_buffer, index=False)
+    csv_data = '\ufeff' + csv_buffer.getvalue()
+    return csv_data.encode("utf-8")
+
+
+def ideas_xlsx_bytes(df):
+    xlsx_buffer = io.BytesIO()
+    with pd.ExcelWriter(xlsx_buffer, engine="xlsxwriter") as writer:
+        df.to_excel(writer, index=False, sheet_name="Collected Ideas")
+        writer.sheets["Collected Ideas"].set_column(0, 0, 30)
+        writer.sheets["Collected Ideas"].set_column(1, 1, 80)
+    return xlsx_buffer.getvalue()
+
+
+def transcript_markdown_bytes(discussion_topic, messages, user_inputs, display_name):
+    # 依輪次整理：每輪先依序列出 AI 的回應，最後才是使用者看完回應後送出的輸入（每輪都以它結尾；
+    # 還原的舊紀錄沒有 user_inputs 時，直接列出那則使用者訊息）
+    lines = [f"# {discussion_topic}", ""]
+    for round_num, round_messages in enumerate(group_messages_by_round(messages)):
+        lines += [f"## 第 {round_num} 輪", ""]
+        for message in round_messages:
+            if message["role"] == "user" and user_inputs.get(round_num):
+                lines += [f"> 使用者輸入：{user_inputs[round_num]}", ""]
+            else:
+                lines += [f"**{display_name(message['role'])}**", "", message["content"].strip(), ""]
+    return "\n".join(lines).encode("utf-8")
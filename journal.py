@@ -0,0 +1,92 @@
+# 本地的 append-only 日誌（JSONL）
+# 每輪的快照先寫到這裡（fsync 之後才回傳），再由背景 thread 同步到 Supabase；
+# Supabase 很慢或連不上時，使用者只需要等本地磁碟，process 重新啟動後也能從日誌補送還沒同步的快照。
+#
+# fsync 是分批的（group commit）：一個 thread 在 fsync 的時候，其他寫進來的快照等下一次 fsync 一起落盤，
+# 同時結束很多輪時不會變成一輪一次 fsync 排隊。
+import json
+import os
+import threading
+
+
+DEFAULT_JOURNAL_PATH = ".journal/conversations.jsonl"
+# 全部同步完、且日誌超過這個大小時才清空（避免每輪都截斷檔案）
+TRUNCATE_BYTES = 1024 * 1024
+
+
+class SnapshotJournal:
+    def __init__(self, path=DEFAULT_JOURNAL_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._repair()
+        self._file = open(path, "ab")
+        self._end = self._file.tell()
+        self._durable = self._end
+        self._syncing = False
+        self._condition = threading.Condition()
+        self._stats = {"appends": 0, "fsyncs": 0}
+
+    def _repair(self):
+        # 寫到一半當機會留下沒有換行的最後一行，截掉它
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+    def append(self, record):
+        # 回傳這筆快照在日誌裡的 (起點, 終點)；回傳時已經 fsync
+        line = (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._condition:
+            offset = self._end
+            self._file.write(line)
+            self._file.flush()
+            self._end += len(line)
+            end = self._end
+            self._stats["appends"] += 1
+
+            while self._durable < end:
+                if self._syncing:
+                    self._condition.wait()
+                    continue
+                # 由這個 thread 負責 fsync，涵蓋到目前為止所有寫進來的快照；fsync 時放開鎖讓其他人繼續寫
+                self._syncing = True
+                target = self._end
+                self._condition.release()
+                try:
+                    os.fsync(self._file.fileno())
+                finally:
+                    self._condition.acquire()
+                    self._syncing = False
+                    self._condition.notify_all()
+                self._durable = max(self._durable, target)
+                self._stats["fsyncs"] += 1
+        return offset, end
+
+    def read(self, offset):
+        # 重新啟動時用：讀出 offset 之後（已 fsync）的每筆快照 (起點, 終點, record)
+        with self._condition:
+            durable = self._durable
+        entries = []
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            for line in f.read(durable - offset).splitlines(keepends=True):
+                entries.append((offset, offset + len(line), json.loads(line)))
+                offset += len(line)
+        return entries
+
+    def truncate_if_synced(self, checkpoint, min_bytes=TRUNCATE_BYTES):
+        # checkpoint 之前都已同步；剛好是日誌結尾、而且檔案夠大時清空，回傳是否清空
+        with self._condition:
+            if self._syncing or checkpoint != self._end or self._end < min_bytes:
+                return False
+            self._file.seek(0)
+            self._file.truncate()
+            os.fsync(self._file.fileno())
+            self._end = self._durable = 0
+            return True
+
+    def stats(self):
+        with self._condition:
+            return dict(self._stats, bytes=self._end)
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import threading
+
+import diskcache
+
+
+# 預設快取設定：放在專案的 .cache 底下，超過大小上限時以 LRU 淘汰，每筆保留 7 天
+DEFAULT_CACHE_DIR = ".cache/llm_responses"
+DEFAULT_SIZE_LIMIT = 512 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+
+# 不放進 extra 的參數：
+# - stream、stream_options 只是傳輸方式，不影響模型輸出
+# - messages、model、temperature 會影響輸出，但已經分別以 prompt / system_message、model、temperature 放進 key，
+#   不能因為這裡略過就把它們從 key 拿掉
+IGNORED_PARAMS = ["stream", "stream_options", "messages", "model", "temperature"]
+
+
+def _sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def request_fingerprint(autogen_key):
+    # autogen 傳進來的 key 是整個 request 參數的 JSON，這裡整理成
+    # model + temperature + system_message + prompt 的雜湊
+    try:
+        params = json.loads(autogen_key)
+    except (TypeError, ValueError):
+        return _sha256(str(autogen_key))
+
+    messages = params.get("messages", [])
+    system_message = "".join(str(m.get("content") or "") for m in messages if m.get("role") == "system")
+    # autogen 會在每則訊息加上 name（agent 名稱，含每個 session 不同的 uuid），
+    # 不拿掉的話不同參與者送出一模一樣的 prompt 也永遠對不到同一個 key
+    prompt = [{k: v for k, v in m.items() if k != "name"} for m in messages if m.get("role") != "system"]
+    extra = {k: v for k, v in params.items() if k not in IGNORED_PARAMS}
+
+    fingerprint = {
+        "model": params.get("model"),
+        "temperature": params.get("temperature"),
+        "system_message": _sha256(system_message),
+        "prompt": _sha256(json.dumps(prompt, ensure_ascii=False, sort_keys=True)),
+        "extra": _sha256(json.dumps(extra, ensure_ascii=False, sort_keys=True, default=str)),
+    }
+    return _sha256(json.dumps(fingerprint, sort_keys=True))
+
+
+class LLMResponseCache:
+    # 符合 autogen AbstractCache 介面（get / set / close / with），可以直接傳給 a_initiate_chat(cache=...)
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, size_limit=DEFAULT_SIZE_LIMIT, ttl=DEFAULT_TTL_SECONDS):
+        self.ttl = ttl
+        self.cache = diskcache.Cache(
+            directory,
+            size_limit=size_limit,
+            eviction_policy="least-recently-used",
+        )
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    def get(self, key, default=None):
+        value = self.cache.get(request_fingerprint(key), default)
+        with self._lock:
+            if value is default:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.cache.set(request_fingerprint(key), value, expire=self.ttl)
+        with self._lock:
+            self.writes += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self.cache),
+                "size_bytes": self.cache.volume(),
+            }
+
+    def clear(self):
+        self.cache.clear()
+
+    def close(self):
+        self.cache.close()
+
+    # autogen 每次呼叫都會用 with 包起來；快取是整個 process 共用的，離開時不要關掉
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return None
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    # 整個 process 共用同一個快取（Streamlit 每次 rerun 都會重新執行主程式，但不會重新 import 這個模組）
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = LLMResponseCache()
+        return _response_cache
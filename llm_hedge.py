@@ -0,0 +1,117 @@
+# 慢回應的備援請求（hedged request）
+# 本地模型偶爾會有單一請求卡住幾十秒；某次呼叫超過該模型近期延遲的百分位數時，
+# 再送一個相同的請求（同一個端點或指定的備援模型），先回來的結果為準，另一個取消。
+import asyncio
+import logging
+import statistics
+import threading
+import time
+from collections import defaultdict, deque
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PERCENTILE = 95
+# 樣本不夠時用固定秒數；也不要短於 MIN_HEDGE_DELAY，避免一開始就大量重送
+MIN_SAMPLES = 20
+DEFAULT_HEDGE_DELAY = 20.0
+MIN_HEDGE_DELAY = 2.0
+MAX_LATENCY_SAMPLES = 500
+MAX_CALL_RECORDS = 200
+
+
+class StreamCancelled(Exception):
+    # 串流中的請求輸掉時，在下一個 token 印出前丟出，讓 OpenAI 的串流迴圈中止、釋放連線
+    pass
+
+
+class LatencyTracker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latencies = defaultdict(lambda: deque(maxlen=MAX_LATENCY_SAMPLES))
+        self._calls = deque(maxlen=MAX_CALL_RECORDS)
+
+    def hedge_delay(self, model, percentile=DEFAULT_PERCENTILE):
+        with self._lock:
+            samples = list(self._latencies[model])
+        if len(samples) < MIN_SAMPLES:
+            return DEFAULT_HEDGE_DELAY
+        cut_points = statistics.quantiles(samples, n=100)
+        return max(cut_points[min(max(int(percentile), 1), 99) - 1], MIN_HEDGE_DELAY)
+
+    def record_call(self, agent_name, model, seconds, hedge_fired, winner):
+        logger.info("llm call agent=%s model=%s seconds=%.2f hedge_fired=%s winner=%s", agent_name, model, seconds, hedge_fired, winner)
+        with self._lock:
+            self._latencies[model].append(seconds)
+            self._calls.append({
+                "agent": agent_name,
+                "model": model,
+                "seconds": seconds,
+                "hedge_fired": hedge_fired,
+                "winner": winner,
+            })
+
+    def calls(self):
+        with self._lock:
+            return list(self._calls)
+
+
+async def timed_call(primary):
+    # 不送備援時也跟 hedged_call 一樣，從 primary 取得限流名額（started.set()）才開始計時，
+    # 排隊時間算進延遲的話，人一多百分位數就被拉高，備援幾乎不會觸發
+    # 回傳（結果, 從取得名額到拿到結果的秒數）
+    started = asyncio.Event()
+    primary_task = asyncio.ensure_future(primary(started))
+    started_task = asyncio.ensure_future(started.wait())
+    try:
+        await asyncio.wait({primary_task, started_task}, return_when=asyncio.FIRST_COMPLETED)
+        start = time.monotonic()
+        return await primary_task, time.monotonic() - start
+    finally:
+        started_task.cancel()
+        if not primary_task.done():
+            primary_task.cancel()
+
+
+async def hedged_call(primary, hedge, delay):
+    # primary(started) 取得限流名額後要 started.set()，延遲從那時開始算，排隊時間不計入
+    # 回傳（結果, 是否送出備援, 勝出的一方, 從開始送出到拿到結果的秒數）
+    started = asyncio.Event()
+    primary_task = asyncio.ensure_future(primary(started))
+    started_task = asyncio.ensure_future(started.wait())
+    tasks = {primary_task: "primary"}
+    try:
+        await asyncio.wait({primary_task, started_task}, return_when=asyncio.FIRST_COMPLETED)
+        start = time.monotonic()
+        done, _ = await asyncio.wait({primary_task}, timeout=delay)
+        if done:
+            return primary_task.result(), False, "primary", time.monotonic() - start
+
+        hedge_task = asyncio.ensure_future(hedge())
+        tasks[hedge_task] = "hedge"
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), True, tasks[task], time.monotonic() - start
+        # 兩個都失敗，回報原本請求的錯誤
+        return primary_task.result(), True, "primary", time.monotonic() - start
+    finally:
+        started_task.cancel()
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+_latency_tracker = None
+_latency_tracker_lock = threading.Lock()
+
+
+def get_latency_tracker():
+    # 延遲分布是整個 process 共用的，所有 session 的呼叫都算進去
+    global _latency_tracker
+    with _latency_tracker_lock:
+        if _latency_tracker is None:
+            _latency_tracker = LatencyTracker()
+        return _latency_tracker
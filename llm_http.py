@@ -0,0 +1,133 @@
+# 整個 process 共用的 LLM HTTP 連線池
+# 每個 session 的 agent 原本各自建立 OpenAI client（各自一組 httpx 連線、各自做 TLS handshake），
+# 這裡改成所有 session 共用同一個 keep-alive 連線池，並記錄連線池大小與等待時間。
+import statistics
+import threading
+import time
+from collections import deque
+
+import httpx
+
+from llm_usage import tap_stream_usage
+
+
+DEFAULT_MAX_CONNECTIONS = 64
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 32
+DEFAULT_KEEPALIVE_EXPIRY = 60.0
+# 跟 openai 套件的預設值一樣；每個請求實際的 timeout 仍由 openai client 指定
+DEFAULT_TIMEOUT = httpx.Timeout(600.0, connect=5.0)
+
+MAX_WAIT_SAMPLES = 500
+
+
+class PoolMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.waits = deque(maxlen=MAX_WAIT_SAMPLES)
+        self.requests = 0
+        self.new_connections = 0
+        self.reused_connections = 0
+        self.in_flight = 0
+
+    def request_started(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+
+    def request_finished(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def record_wait(self, seconds, new_connection):
+        with self._lock:
+            self.waits.append(seconds)
+            if new_connection:
+                self.new_connections += 1
+            else:
+                self.reused_connections += 1
+
+    def snapshot(self):
+        with self._lock:
+            waits = list(self.waits)
+            return {
+                "requests": self.requests,
+                "in_flight": self.in_flight,
+                "new_connections": self.new_connections,
+                "reused_connections": self.reused_connections,
+                "wait_avg_ms": statistics.fmean(waits) * 1000 if waits else 0.0,
+                "wait_max_ms": max(waits) * 1000 if waits else 0.0,
+            }
+
+
+class PoolMetricsTransport(httpx.HTTPTransport):
+    def __init__(self, metrics, **kwargs):
+        super().__init__(**kwargs)
+        self.metrics = metrics
+
+    def handle_request(self, request):
+        # 從進入連線池到第一個 httpcore trace 事件之間，就是等待連線的時間：
+        # 新連線的第一個事件是 connection.connect_tcp，沿用既有連線則直接是 http11/http2 送 header
+        start = time.perf_counter()
+        first_event = []
+
+        def trace(event_name, info):
+            if not first_event:
+                first_event.append(event_name)
+                self.metrics.record_wait(time.perf_counter() - start, event_name.startswith("connection."))
+
+        request.extensions = {**request.extensions, "trace": trace}
+        self.metrics.request_started()
+        try:
+            return tap_stream_usage(super().handle_request(request))
+        finally:
+            self.metrics.request_finished()
+
+    def pool_size(self):
+        connections = list(self._pool.connections)
+        return {
+            "connections": len(connections),
+            "idle": sum(1 for c in connections if c.is_idle()),
+        }
+
+
+class SharedHTTPClient(httpx.Client):
+    # autogen 建立 agent 時會 deepcopy llm_config；共用的連線池不能被複製
+    def __deepcopy__(self, memo):
+        return self
+
+    def __copy__(self):
+        return self
+
+
+class LLMConnectionPool:
+    def __init__(self, max_connections=DEFAULT_MAX_CONNECTIONS, max_keepalive_connections=DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+                 keepalive_expiry=DEFAULT_KEEPALIVE_EXPIRY):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.metrics = PoolMetrics()
+        self.transport = PoolMetricsTransport(self.metrics, limits=self.limits)
+        self.client = SharedHTTPClient(transport=self.transport, timeout=DEFAULT_TIMEOUT, follow_redirects=True)
+
+    def stats(self):
+        return {
+            **self.metrics.snapshot(),
+            **self.transport.pool_size(),
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+        }
+
+
+_connection_pool = None
+_connection_pool_lock = threading.Lock()
+
+
+def get_connection_pool(max_connections=DEFAULT_MAX_CONNECTIONS, max_keepalive_connections=DEFAULT_MAX_KEEPALIVE_CONNECTIONS):
+    # 整個 process 只建立一次；連線上限以第一次建立時的設定為準
+    global _connection_pool
+    with _connection_pool_lock:
+        if _connection_pool is None:
+            _connection_pool = LLMConnectionPool(max_connections, max_keepalive_connections)
+        return _connection_pool
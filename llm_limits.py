@@ -0,0 +1,147 @@
+# 整個 process 共用的 LLM 請求排隊與限流
+# 一整班同時開始第 0 輪時，所有 session 的請求會一起撞上 provider 的 RPM / TPM 上限；
+# 這裡每個模型一組 token bucket（每分鐘請求數、每分鐘 token 數）加上同時請求數上限，依先來後到放行。
+# 每個 Streamlit session 各自用 asyncio.run 跑自己的 event loop，所以用 threading 的鎖，等待時以 asyncio.sleep 輪詢。
+import asyncio
+import contextlib
+import itertools
+import threading
+import time
+
+
+# OpenAI tier 1 的上限；本地模型沒有 RPM / TPM，只限制同時請求數
+MODEL_LIMITS = {
+    "gpt-4o-mini": {"rpm": 500, "tpm": 200000, "max_concurrency": 16},
+    "gpt-4o": {"rpm": 500, "tpm": 30000, "max_concurrency": 16},
+}
+LOCAL_MODEL_LIMITS = {"rpm": None, "tpm": None, "max_concurrency": 4}
+
+# 請求送出前不知道實際用量，用 prompt 字數（中文約一字一 token）加上預估的回應長度
+ESTIMATED_COMPLETION_TOKENS = 500
+POLL_SECONDS = 0.25
+# 還沒有任何請求完成時，估計 ETA 用的單次請求時間
+DEFAULT_REQUEST_SECONDS = 10.0
+
+
+def estimate_tokens(message):
+    return len(message) + ESTIMATED_COMPLETION_TOKENS
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def seconds_until(self, amount):
+        return max(amount - self.level, 0.0) / self.rate
+
+
+class ModelLimiter:
+    def __init__(self, model, rpm=None, tpm=None, max_concurrency=4):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.active = 0
+        self.avg_request_seconds = DEFAULT_REQUEST_SECONDS
+        self._queue = []  # [(ticket, tokens)]，先來先放行
+        self._tickets = itertools.count()
+        self._lock = threading.Lock()
+
+    def _cost(self, tokens):
+        # 單一請求超過整個 TPM 時，最多等到 bucket 全滿就放行，不然會永遠排不到
+        return min(tokens, self.tokens.capacity) if self.tokens else tokens
+
+    def _try_admit(self, ticket):
+        now = time.monotonic()
+        for bucket in (self.requests, self.tokens):
+            if bucket:
+                bucket.refill(now)
+
+        if self._queue[0][0] != ticket or self.active >= self.max_concurrency:
+            return False
+        cost = self._cost(self._queue[0][1])
+        if self.requests and self.requests.level < 1:
+            return False
+        if self.tokens and self.tokens.level < cost:
+            return False
+
+        if self.requests:
+            self.requests.level -= 1
+        if self.tokens:
+            self.tokens.level -= cost
+        self._queue.pop(0)
+        self.active += 1
+        return True
+
+    def _wait_estimate(self, ticket):
+        # 回傳（前面還有幾個請求, 預計等待秒數）
+        position = next(i for i, (t, _) in enumerate(self._queue) if t == ticket)
+        ahead = self._queue[:position + 1]
+
+        eta = 0.0
+        if self.requests:
+            eta = max(eta, self.requests.seconds_until(len(ahead)))
+        if self.tokens:
+            eta = max(eta, self.tokens.seconds_until(sum(self._cost(tokens) for _, tokens in ahead)))
+        if self.active >= self.max_concurrency or position >= self.max_concurrency - self.active:
+            eta = max(eta, self.avg_request_seconds * (position // self.max_concurrency + 1))
+        return position, eta
+
+    @contextlib.asynccontextmanager
+    async def slot(self, tokens, on_wait=None):
+        with self._lock:
+            ticket = next(self._tickets)
+            self._queue.append((ticket, tokens))
+        try:
+            while True:
+                with self._lock:
+                    if self._try_admit(ticket):
+                        break
+                    position, eta = self._wait_estimate(ticket)
+                if on_wait:
+                    on_wait(position, eta)
+                await asyncio.sleep(POLL_SECONDS)
+        except BaseException:
+            # 使用者中斷（Streamlit rerun）時把自己從隊伍裡移掉
+            with self._lock:
+                self._queue = [entry for entry in self._queue if entry[0] != ticket]
+            raise
+
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.active -= 1
+                # 指數移動平均，用來估計排隊的 ETA
+                self.avg_request_seconds = 0.8 * self.avg_request_seconds + 0.2 * (time.monotonic() - start)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queued": len(self._queue),
+                "active": self.active,
+                "max_concurrency": self.max_concurrency,
+                "avg_request_seconds": self.avg_request_seconds,
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_model_limiter(model, local=False, overrides=None):
+    # 每個模型在整個 process 只有一組限流；overrides 來自 secrets，只在第一次建立時生效
+    with _limiters_lock:
+        if model not in _limiters:
+            limits = dict(LOCAL_MODEL_LIMITS if local else MODEL_LIMITS.get(model, LOCAL_MODEL_LIMITS))
+            limits.update(overrides or {})
+            _limiters[model] = ModelLimiter(model, **limits)
+        return _limiters[model]
@@ -0,0 +1,145 @@
+# 每次 LLM 回應的 token 用量（含 provider prompt cache 命中的 cached_tokens）
+# autogen 不會把原始 response 交回給 a_initiate_chat 的呼叫端，這裡用它的 runtime logging 介面接住每個 ChatCompletion。
+# 串流時 autogen 自己用 count_token 估 usage（沒有 cached_tokens），所以請求會帶 stream_options.include_usage，
+# 再由 llm_http 的 transport 從最後一個 chunk 讀出真正的 usage。
+import json
+import threading
+import uuid
+from collections import defaultdict, deque
+
+import autogen.runtime_logging
+import httpx
+from autogen.logger.base_logger import BaseLogger
+
+
+MAX_RECORDS_PER_AGENT = 200
+
+
+# 串流的讀取、autogen 組回 ChatCompletion、再呼叫 log_chat_completion 都在同一個 executor thread 裡依序發生
+_stream_usage = threading.local()
+
+
+class StreamUsageTap(httpx.SyncByteStream):
+    # SSE 原樣往下傳，同時找出帶 usage 的 chunk（include_usage 時是最後一個、choices 為空的 chunk）
+    def __init__(self, stream):
+        self._stream = stream
+        self._buffer = b""
+        _stream_usage.value = None
+
+    def __iter__(self):
+        for part in self._stream:
+            self._scan(part)
+            yield part
+
+    def _scan(self, part):
+        self._buffer += part
+        *lines, self._buffer = self._buffer.split(b"\n")
+        for line in lines:
+            if line.startswith(b"data: {") and b'"usage"' in line:
+                usage = json.loads(line[len(b"data: "):]).get("usage")
+                if usage:
+                    _stream_usage.value = usage
+
+    def close(self):
+        self._stream.close()
+
+
+def tap_stream_usage(response):
+    if response.headers.get("content-type", "").startswith("text/event-stream"):
+        response.stream = StreamUsageTap(response.stream)
+    return response
+
+
+def _pop_stream_usage():
+    usage = getattr(_stream_usage, "value", None)
+    _stream_usage.value = None
+    return usage
+
+
+def _usage_of(response, stream_usage=None):
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return None
+
+    # 串流模式下 autogen 會自己拼出 usage，沒有 prompt_tokens_details；有串流最後一個 chunk 的 usage 就用它
+    details = getattr(usage, "prompt_tokens_details", None)
+    if details is None and stream_usage:
+        return {
+            "prompt_tokens": stream_usage.get("prompt_tokens"),
+            "completion_tokens": stream_usage.get("completion_tokens"),
+            "cached_tokens": (stream_usage.get("prompt_tokens_details") or {}).get("cached_tokens"),
+        }
+    cached_tokens = getattr(details, "cached_tokens", None) if details is not None else None
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "cached_tokens": cached_tokens,
+    }
+
+
+class UsageLogger(BaseLogger):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records = defaultdict(lambda: deque(maxlen=MAX_RECORDS_PER_AGENT))
+
+    def start(self):
+        return str(uuid.uuid4())
+
+    def log_chat_completion(self, invocation_id, client_id, wrapper_id, source, request, response, is_cached, cost, start_time):
+        usage = _usage_of(response, _pop_stream_usage())
+        if usage is None:
+            return
+        name = getattr(source, "name", str(source))
+        with self._lock:
+            self._records[name].append({**usage, "is_cached": bool(is_cached), "start_time": start_time})
+
+    def records(self, agent_name):
+        with self._lock:
+            return list(self._records.get(agent_name, []))
+
+    def log_new_agent(self, agent, init_args):
+        pass
+
+    def log_event(self, source, name, **kwargs):
+        pass
+
+    def log_new_wrapper(self, wrapper, init_args):
+        pass
+
+    def log_new_client(self, client, wrapper, init_args):
+        pass
+
+    def log_function_use(self, source, function, args, returns):
+        pass
+
+    def stop(self):
+        pass
+
+    def get_connection(self):
+        return None
+
+
+_usage_logger = None
+_usage_logger_lock = threading.Lock()
+
+
+def get_usage_logger():
+    # runtime logging 是整個 process 共用的，只啟動一次
+    global _usage_logger
+    with _usage_logger_lock:
+        if _usage_logger is None:
+            _usage_logger = UsageLogger()
+            autogen.runtime_logging.start(logger=_usage_logger)
+        return _usage_logger
+
+
+def usage_summary(records):
+    prompt_tokens = sum(r["prompt_tokens"] or 0 for r in records)
+    cached_tokens = sum(r["cached_tokens"] or 0 for r in records)
+    return {
+        "requests": len(records),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": sum(r["completion_tokens"] or 0 for r in records),
+        "cached_tokens": cached_tokens,
+        "cached_ratio": cached_tokens / prompt_tokens if prompt_tokens else 0.0,
+    }
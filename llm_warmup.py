@@ -0,0 +1,103 @@
+# 本地模型（base_url）的 prompt 預熱
+# 本地 server（llama.cpp / LM Studio）會快取最近處理過的 prompt 前綴，
+# 事先用只生成 1 個 token 的請求把各角色的固定前綴送過去，第一輪就不用再從頭 prefill。
+import threading
+import time
+
+import requests
+
+
+WARMUP_TIMEOUT_SECONDS = 120
+# 閒置超過這個時間就再預熱一次（server 可能已經把前綴擠出快取）
+IDLE_REWARM_SECONDS = 300
+IDLE_CHECK_SECONDS = 30
+
+
+class PrefixWarmer:
+    def __init__(self, base_url, model, api_key, prefixes, idle_seconds=IDLE_REWARM_SECONDS):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.api_key = api_key
+        self.prefixes = prefixes  # {顯示名稱: 前綴文字}
+        self.idle_seconds = idle_seconds
+        self.results = {}
+        self.last_activity = 0.0
+        self.last_warmup = 0.0
+        self.error = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _timed_request(self, prefix):
+        # 跟 app 一樣：system message 是 UserProxyAgent 的空字串，角色設定放在 user 訊息裡
+        payload = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": ""},
+                {"role": "user", "content": prefix},
+            ],
+            "max_tokens": 1,
+            "temperature": 0,
+            "stream": False,
+        }
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        start = time.perf_counter()
+        response = requests.post(f"{self.base_url}/chat/completions", json=payload, headers=headers, timeout=WARMUP_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+    def warm(self):
+        # 同一個前綴送兩次：第一次是冷的 prefill，第二次命中快取，兩者相減就是省下的時間
+        for name, prefix in self.prefixes.items():
+            try:
+                cold = self._timed_request(prefix)
+                warm = self._timed_request(prefix)
+            except requests.RequestException as e:
+                with self._lock:
+                    self.error = str(e)
+                return
+            with self._lock:
+                self.results[name] = {
+                    "cold_seconds": cold,
+                    "warm_seconds": warm,
+                    "saved_seconds": max(cold - warm, 0.0),
+                    "warmed_at": time.time(),
+                }
+                self.error = None
+        with self._lock:
+            self.last_warmup = time.time()
+
+    def note_activity(self):
+        with self._lock:
+            self.last_activity = time.time()
+
+    def _run(self):
+        self.warm()
+        while True:
+            time.sleep(IDLE_CHECK_SECONDS)
+            with self._lock:
+                idle_since = max(self.last_activity, self.last_warmup)
+            if time.time() - idle_since >= self.idle_seconds:
+                self.warm()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"prefix-warmer-{self.model}", daemon=True)
+            self._thread.start()
+
+    def report(self):
+        with self._lock:
+            return {"results": dict(self.results), "error": self.error}
+
+
+_warmers = {}
+_warmers_lock = threading.Lock()
+
+
+def get_prefix_warmer(base_url, model, api_key, prefixes):
+    # 每個 (base_url, model) 在整個 process 只啟動一個預熱執行緒
+    with _warmers_lock:
+        key = (base_url, model)
+        if key not in _warmers:
+            _warmers[key] = PrefixWarmer(base_url, model, api_key, prefixes)
+            _warmers[key].start()
+        return _warmers[key]
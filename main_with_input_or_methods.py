@@ -3,25 +3,42 @@ import asyncio
 import re
 from autogen import AssistantAgent, UserProxyAgent
 from autogen import ConversableAgent
-import pandas as pd
+from autogen.io import IOStream
 import plotly.express as px
 import logging
 import os
 from dotenv import load_dotenv
 import textwrap
-import time
 import uuid
 
 import os
 import shutil
-import markdown2
-import io
 import datetime
 import streamlit.components.v1 as components
 import streamlit as st
-from supabase import create_client, Client
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+import threading
 import json
-import requests
+
+from assets import asset_url, avatar_image
+from chat_render import PAGE_STYLESHEET, fadein_html, group_messages_by_round, sentences_html, user_bubble_html
+from exports import EXPORT_FORMATS, collected_ideas_frame, ideas_csv_bytes, ideas_xlsx_bytes, transcript_markdown_bytes
+from journal import DEFAULT_JOURNAL_PATH
+from llm_cache import get_response_cache
+from llm_hedge import DEFAULT_PERCENTILE, StreamCancelled, get_latency_tracker, hedged_call, timed_call
+from llm_limits import estimate_tokens, get_model_limiter
+from llm_http import DEFAULT_MAX_CONNECTIONS, DEFAULT_MAX_KEEPALIVE_CONNECTIONS, get_connection_pool
+from llm_usage import get_usage_logger, usage_summary
+from llm_warmup import get_prefix_warmer
+from persistence import PersistError, get_write_queue
+from prompts import (
+    AGENT_CONFIG, ASSISTANT_SYSTEM_MESSAGE, QUESTION_OPTIONS, QUESTION_PLACEHOLDER, neutral_prompt,
+    round0_discussion_message, round0_agent_message, category_prompt, persona_prefix,
+    agent_static_prefix, assemble_prompt, discussion_format_rules,
+)
+from round0_pool import sample_round0_entry
+from session_cache import get_session_cache
+from text_processing import extract_ideas, strip_emphasis, strip_markdown
 
 
 os.environ["AUTOGEN_USE_DOCKER"] = "0"
@@ -30,8 +47,12 @@ os.environ["AUTOGEN_USE_DOCKER"] = "0"
 SUPABASE_URL = st.secrets["supabase"]["url"]
 SUPABASE_SERVICE_KEY = st.secrets["supabase"]["service_key"]
 
-# 建立連線
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+# 對話紀錄的背景寫入佇列（共用 keep-alive 連線，一次 upsert 寫入）
+persistence_settings = st.secrets.get("persistence", {})
+write_queue = get_write_queue(
+    SUPABASE_URL, SUPABASE_SERVICE_KEY, persistence_settings.get("mode", "snapshot"),
+    persistence_settings.get("journal_path", DEFAULT_JOURNAL_PATH) if persistence_settings.get("journal", True) else None,
+)
 
 def store_messages(silent: bool = False):
     # 取得本輪訊息
@@ -47,43 +68,17 @@ def store_messages(silent: bool = False):
         "selected_ideas": selected_ideas  # <== 新增這一行
     }
 
-    # API 基本資訊
-    endpoint = f"{SUPABASE_URL}/rest/v1/conversations"
-    headers = {
-        "apikey": SUPABASE_SERVICE_KEY,
-        "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-        "Content-Type": "application/json",
-        "Prefer": "return=representation"
-    }
-
-    # 檢查是否已有記錄
-    check_response = requests.get(f"{endpoint}?session_id=eq.{user_session_id}", headers=headers)
-
-    if check_response.status_code == 200 and check_response.json():
-        # 已存在，更新
-        existing_id = check_response.json()[0]["id"]
-        update_endpoint = f"{endpoint}?id=eq.{existing_id}"
-        update_response = requests.patch(update_endpoint, headers=headers, json=record)
-
-        if not silent:
-            if update_response.status_code in [200, 204]:
-                st.toast("已更新 Supabase 記錄（包含收藏 Ideas）", icon="✅")
-            else:
-                st.error(f"❌ 更新失敗: {update_response.status_code} - {update_response.text}")
-
-        return update_response.status_code in [200, 204]
-
-    else:
-        # 不存在，新增
-        response = requests.post(endpoint, headers=headers, json=record)
+    # 只放進 write-behind 佇列，由背景 thread 寫入 Supabase（不等網路來回）
+    previous_error = write_queue.last_error(user_session_id)
+    write_queue.enqueue(user_session_id, record)
 
-        if not silent:
-            if response.status_code in [200, 201]:
-                st.toast("已新增到 Supabase（包含收藏 Ideas）", icon="✅")
-            else:
-                st.error(f"❌ 新增失敗: {response.status_code} - {response.text}")
+    if not silent:
+        if previous_error:
+            st.error(f"❌ 上一次寫入失敗，正在重試: {previous_error}")
+        else:
+            st.toast("已排入 Supabase 寫入佇列（包含收藏 Ideas）", icon="✅")
 
-        return response.status_code in [200, 201]
+    return previous_error is None
 
 
 # 設定 Streamlit 頁面
@@ -127,26 +122,17 @@ with st.sidebar:
             st.success(f"✅ 目前 Session UUID: {user_session_id}")
 
 if f"{user_session_id}_messages" not in st.session_state:
-    # 🟢 建立 RESTful API 查詢 URL
-    history_api_url = f"{SUPABASE_URL}/rest/v1/conversations?session_id=eq.{user_session_id}&order=round.asc"
-
-    # 🟢 設定標頭
-    headers = {
-        "apikey": SUPABASE_SERVICE_KEY,
-        "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-        "Accept": "application/json"
-    }
-
-    # 🟢 發送 GET 請求
-    response = requests.get(history_api_url, headers=headers)
+    # 🟢 讀取這個 session 最新的紀錄：還沒同步出去的快照就直接用本地的，否則只向 Supabase 要最新一列
+    try:
+        latest_record = write_queue.pending_snapshot(user_session_id) or write_queue.store.load(user_session_id)
+        load_error = None
+    except PersistError as e:
+        latest_record, load_error = None, str(e)
 
     # 🟢 檢查回應
-    if response.status_code == 200:
-        history_data = response.json()
-
-        if history_data:
+    if load_error is None:
+        if latest_record:
             # 取得最新的紀錄
-            latest_record = history_data[-1]
             latest_messages = latest_record.get("messages", [])
             latest_round = latest_record.get("round", 0)
             latest_selected_ideas = latest_record.get("selected_ideas", [])  # 讀取收藏的 Ideas
@@ -174,7 +160,7 @@ if f"{user_session_id}_messages" not in st.session_state:
         else:
             st.info("ℹ️ 沒有找到任何歷史紀錄")
     else:
-        st.error(f"❌ 請求失敗: {response.status_code} {response.text}")
+        st.error(f"❌ 請求失敗: {load_error}")
 
 # # 顯示從 URL 讀到的參數
 # st.write(f"🔍 從 URL 讀取到的 uid 參數： `{provided_uuid}`")
@@ -184,10 +170,10 @@ if f"{user_session_id}_messages" not in st.session_state:
 
 st.markdown("---")
 
-st.cache_data.clear()  # **確保每個使用者的快取是獨立的**
-st.cache_resource.clear()
-
+# 不再每次執行都清空 st.cache_data / st.cache_resource（那會清掉所有使用者共用的快取）；
+# 只屬於這位使用者的資料放在 session_cache，依 user_session_id 分區
 user_session_id = st.session_state["user_session_id"]
+session_cache = get_session_cache()
 
 # 從 st.secrets 讀取 API Key
 api_key = st.secrets["api_keys"]["OPENAI_API_KEY"]
@@ -231,21 +217,12 @@ if not st.session_state.get(f"{user_session_id}_onboarding_done", False):
     st.stop()
 
 
-st.markdown(
-    """
-<style>
-div[data-testid="stDialog"] div[role="dialog"]:has(.big-dialog) {
-    width: 80vw;
-    max-height: 95vh;
-    overflow-y: auto;
-}
-</style>
-""",
-    unsafe_allow_html=True,
-)
+# 整頁共用的樣式只注入這一次（說明視窗、使用者訊息泡泡、逐句淡入），訊息本身只帶 class 名稱
+st.markdown(PAGE_STYLESHEET, unsafe_allow_html=True)
 
 import base64
 
+@st.cache_data  # 圖片是所有使用者共用的，整個 process 只讀一次
 def get_image_base64(image_path):
     with open(image_path, "rb") as img_file:
         encoded = base64.b64encode(img_file.read()).decode()
@@ -253,6 +230,17 @@ def get_image_base64(image_path):
 
 
 
+@st.cache_data  # 每頁圖片的 HTML 在整個 process 只產生一次，重新開啟說明視窗也直接沿用
+def onboarding_image_html(image):
+    # 使用 HTML 方式顯示圖片：優先用 static/ 裡縮好的 WebP（瀏覽器會快取），還沒產生過才用 base64
+    img_src = asset_url(image) or get_image_base64(f"./{image}")
+    return f"""
+                    <div style='text-align: center;'>
+                        <img src="{img_src}" style="max-width:70%; max-height:auto;" />
+                    </div>
+                    """
+
+
 @st.dialog("系統說明", width="large")
 def show_onboarding_tabs():
     st.html("<span class='big-dialog'></span>")
@@ -262,24 +250,16 @@ def show_onboarding_tabs():
     pages = build_onboarding_pages()
     tab_titles = [p["title"] for p in pages]
 
-    tabs = st.tabs(tab_titles)
-    for tab, page in zip(tabs, pages):
-        with tab:
-            st.write(page["content"])
-            # if "image" in page:
-            #     st.image(page["image"], width=1500)
-            if "image" in page:
-                # 使用 HTML 方式顯示圖片
-                img_src = get_image_base64(f"./{page["image"]}")
-
-                st.markdown(
-                    f"""
-                    <div style='text-align: center;'>
-                        <img src="{img_src}" style="max-width:70%; max-height:auto;" />
-                    </div>
-                    """,
-                    unsafe_allow_html=True
-                )
+    # st.tabs 會一次把所有分頁的內容和圖片都送到瀏覽器；改成只產生目前選到的那一頁
+    # （頁面組合會隨角色 / SCAMPER 設定改變，key 帶上頁面標題，避免沿用到不存在的選項）
+    selected_title = st.radio("說明頁面", tab_titles, horizontal=True, label_visibility="collapsed",
+                              key=f"{user_session_id}_onboarding_tab_{'|'.join(tab_titles)}")
+    page = pages[tab_titles.index(selected_title)]
+    st.write(page["content"])
+    # if "image" in page:
+    #     st.image(page["image"], width=1500)
+    if "image" in page:
+        st.markdown(onboarding_image_html(page["image"]), unsafe_allow_html=True)
 
     if st.button("開始使用！", type="primary"):
         st.session_state[f"{user_session_id}_show_onboarding_modal"] = False
@@ -382,6 +362,13 @@ with st.sidebar:
             base_url = st.text_input("API 端點", "http://127.0.0.1:1234/v1")
         rounds = st.slider("設定討論輪次", min_value=1, max_value=999, value=999, disabled=is_locked)
         temperature = st.slider("設定溫度 (temperature)", min_value=0.0, max_value=2.0, value=1.0, step=0.1, disabled=is_locked)
+        stream_responses = st.checkbox("即時串流顯示回應", value=True, key=f"{user_session_id}_stream_responses", disabled=is_locked)
+        # temperature 為 0 時一律使用回應快取；非零溫度要手動開啟，否則每位參與者都會拿到一樣的回答
+        st.checkbox("非零溫度也使用回應快取", key=f"{user_session_id}_cache_nonzero_temperature", disabled=is_locked)
+        # 回應超過近期延遲的百分位數時再送一個備援請求（預設只對本地模型開啟）
+        st.checkbox("回應過慢時送出備援請求", value=base_url is not None, key=f"{user_session_id}_hedge_enabled", disabled=is_locked)
+        cache_stats = get_response_cache().stats()
+        st.caption(f"回應快取：命中 {cache_stats['hits']} / 未命中 {cache_stats['misses']}（{cache_stats['entries']} 筆）")
         
 
         if is_locked:
@@ -440,6 +427,20 @@ if not base_url and "gpt" not in selected_model:
 #     ]
 # }
 
+# 所有 session 共用同一個 HTTP 連線池（keep-alive），連線上限可在 secrets 的 [llm_http] 設定
+llm_http_settings = st.secrets.get("llm_http", {})
+connection_pool = get_connection_pool(
+    max_connections=llm_http_settings.get("max_connections", DEFAULT_MAX_CONNECTIONS),
+    max_keepalive_connections=llm_http_settings.get("max_keepalive_connections", DEFAULT_MAX_KEEPALIVE_CONNECTIONS),
+)
+
+# 串流與否以 llm_config 為準（顯示、快取、用量都讀它）；討論開始前切換了勾選框就重新建立，
+# agent 建立時已經複製了舊的 llm_config，所以一起清掉，稍後用新的設定重建
+stored_llm_config = st.session_state.get(f"{user_session_id}_llm_config")
+if stored_llm_config is not None and not is_locked and stored_llm_config["config_list"][0]["stream"] != stream_responses:
+    for key in (f"{user_session_id}_llm_config", f"{user_session_id}_agents", f"{user_session_id}_user_proxy"):
+        st.session_state.pop(key, None)
+
 if f"{user_session_id}_llm_config" not in st.session_state:
     st.session_state[f"{user_session_id}_llm_config"] = {
         "config_list": [
@@ -448,74 +449,92 @@ if f"{user_session_id}_llm_config" not in st.session_state:
                 "api_key": api_key,
                 "base_url": base_url,
                 "temperature": temperature,
-                "stream": False
+                "stream": stream_responses,
+                "http_client": connection_pool.client,
+                # 串流時在最後一個 chunk 回傳 usage（含 cached_tokens），側邊欄的 prompt 快取用量才有值
+                **({"stream_options": {"include_usage": True}} if stream_responses else {}),
             }
-        ]
+        ],
+        # 關掉 autogen 預設的 cache_seed 快取（無上限、不分溫度），改用 llm_cache
+        "cache_seed": None
     }
 
-Businessman_prompt = (
-    "你是 Businessman。你是一位在矽谷創業的創辦人，具備出色的產品直覺與商業敏銳度，曾參與多次 seed round 募資。"
-    "你習慣使用的語言包括：market-fit、user pain point、growth loop、viral trigger、pivot、go-to-market strategy、early adopters、unit economics。"
-    "當你提出想法時，請以創投簡報（pitch deck）語氣表達，重點是能否引起使用者共鳴、快速測試商業模式、創造市場話題。"
-
-    "🎯 你的目標是："
-    "1️⃣ 找到具有 **使用者吸引力** 和 **潛在成長性** 的市場切入點\n"
-    "2️⃣ 提出點子要能支撐 **故事性**，讓投資人、媒體、使用者會興奮地想參與\n"
-    "3️⃣ 評估每個點子的 go-to-market 可行性與潛在 revenue stream"
-
-    "🚫 請避免："
-    "談論技術實作細節、工程可行性或開發負擔；你只關心『這東西會不會紅』。"
-
-    "💬 常用語氣範例："
-    "- 『這是一個有潛力切入 Z 世代市場的 viral loop』\n"
-    "- 『這解法非常 pitchable，而且容易吸引早期 media coverage』\n"
-    "- 『我們可以用 freemium 模型驗證 user retention，再逐步轉向付費方案』"
-)
-
-
-Engineer_prompt = (
-    "你是 Engineer。你是這家新創的首席工程師，負責產品的技術落地與資源調度，熟悉 MVP 開發、模組化設計與系統效能考量。"
-    "你重視的是：**可行性、可擴充性、技術負債控制、維護性、以及團隊 bandwidth 是否足夠實作**。"
-
-    "你慣用的詞彙包括：tech stack、latency、code debt、CI/CD、RESTful API、data pipeline、load test、edge case、resource constraint、infra cost。"
-
-    "🎯 你的目標是："
-    "1️⃣ 在預算與時間（2 週內）限制下，找出 **可以做出來的版本**\n"
-    "2️⃣ 評估每個點子從技術觀點有無『高風險地雷』或明顯 impractical 的設計\n"
-    "3️⃣ 主動提出替代技術方案或更快的技術驗證方法"
-
-    "🚫 請避免："
-    "過度關注市場、品牌或使用者成長策略；你只關心『這東西 build 不 build 得出來』。"
+llm_config = st.session_state[f"{user_session_id}_llm_config"]
 
-    "💬 常用語氣範例："
-    "- 『這個需要 edge device 做數據前處理，否則 cloud latency 太高』\n"
-    "- 『我傾向先用 Python 快速測 MVP，再重構成更穩的堆疊』\n"
-    "- 『這個想法不錯，但我們沒足夠 bandwidth 支援 BLE 通訊與 UI 同時開發』"
-)
+# 本地模型：在背景把各角色的固定前綴先送進 server 的 prompt 快取
+prefix_warmer = None
+if llm_config["config_list"][0]["base_url"]:
+    prefix_warmer = get_prefix_warmer(
+        llm_config["config_list"][0]["base_url"],
+        llm_config["config_list"][0]["model"],
+        llm_config["config_list"][0]["api_key"],
+        {config["persona_name"]: persona_prefix(config["persona_prompt"]) for config in AGENT_CONFIG.values()},
+    )
 
-neutral_prompt = (
-    "你是討論創意問題的中立參與者，目標是提出清晰、有邏輯且具啟發性的創新建議。"
-    "請根據使用者的主題與思考方法，提出合理、有創新潛力的觀點，不需考慮特定專業或立場。"
+    with st.sidebar:
+        with st.expander("**本地模型預熱**", expanded=False):
+            warmup_report = prefix_warmer.report()
+            if warmup_report["error"]:
+                st.warning(f"預熱失敗：{warmup_report['error']}")
+            elif not warmup_report["results"]:
+                st.info("預熱中...")
+            for name, result in warmup_report["results"].items():
+                st.write(f"{name}：prefill {result['cold_seconds']:.2f}s → {result['warm_seconds']:.2f}s（節省 {result['saved_seconds']:.2f}s）")
+
+
+# 每個模型一組跨 session 的限流（RPM / TPM / 同時請求數），上限可在 secrets 的 [llm_limits.<模型名稱>] 覆寫
+model_limiter = get_model_limiter(
+    llm_config["config_list"][0]["model"],
+    local=bool(llm_config["config_list"][0]["base_url"]),
+    overrides=dict(st.secrets.get("llm_limits", {}).get(llm_config["config_list"][0]["model"], {})),
 )
 
-
-AGENT_CONFIG = {
-    "Agent A": {
-        "persona_name": "Businessman",
-        "persona_prompt": Businessman_prompt,
-        "neutral_name": "Agent A",
-        "avatar": "businessman.png"
-    },
-    "Agent B": {
-        "persona_name": "Engineer",
-        "persona_prompt": Engineer_prompt,
-        "neutral_name": "Agent B",
-        "avatar": "engineer.png"
+# 備援請求：預設送到同一個端點；secrets 的 [llm_hedge] 可指定 fallback_model（例如 gpt-4o-mini）與 percentile
+hedge_settings = st.secrets.get("llm_hedge", {})
+latency_tracker = get_latency_tracker()
+if hedge_settings.get("fallback_model"):
+    hedge_llm_config = {
+        "config_list": [
+            {
+                "model": hedge_settings["fallback_model"],
+                "api_key": api_key,
+                "base_url": None,
+                "temperature": llm_config["config_list"][0]["temperature"],
+                "stream": False,
+                "http_client": connection_pool.client
+            }
+        ],
+        "cache_seed": None
     }
-}
-
+    hedge_limiter = get_model_limiter(hedge_settings["fallback_model"])
+else:
+    hedge_llm_config = {
+        "config_list": [{**{k: v for k, v in llm_config["config_list"][0].items() if k != "stream_options"}, "stream": False}],
+        "cache_seed": None
+    }
+    hedge_limiter = model_limiter
 
-llm_config = st.session_state[f"{user_session_id}_llm_config"]
+with st.sidebar:
+    with st.expander("**LLM 連線池與排隊**", expanded=False):
+        pool_stats = connection_pool.stats()
+        st.write(f"連線數：{pool_stats['connections']} / {pool_stats['max_connections']}（閒置 {pool_stats['idle']}）")
+        st.write(f"請求數：{pool_stats['requests']}（進行中 {pool_stats['in_flight']}）")
+        st.write(f"新建連線 {pool_stats['new_connections']} / 沿用連線 {pool_stats['reused_connections']}")
+        st.write(f"等待連線：平均 {pool_stats['wait_avg_ms']:.1f} ms，最長 {pool_stats['wait_max_ms']:.1f} ms")
+        limiter_stats = model_limiter.stats()
+        st.write(f"{llm_config['config_list'][0]['model']} 排隊中 {limiter_stats['queued']}，進行中 {limiter_stats['active']} / {limiter_stats['max_concurrency']}")
+        recent_calls = latency_tracker.calls()
+        if recent_calls:
+            hedged_calls = [c for c in recent_calls if c["hedge_fired"]]
+            st.write(f"最近 {len(recent_calls)} 次呼叫：送出備援 {len(hedged_calls)} 次，備援勝出 {sum(1 for c in hedged_calls if c['winner'] == 'hedge')} 次")
+
+    with st.expander("**對話紀錄儲存**", expanded=False):
+        queue_stats = write_queue.stats()
+        st.write(f"等待寫入 {queue_stats['pending']}，已寫入 {queue_stats['written']}（合併 {queue_stats['coalesced']}、重試 {queue_stats['retries']}、放棄 {queue_stats['dropped']}）")
+        if "journal_bytes" in queue_stats:
+            st.write(f"本地日誌 {queue_stats['journal_bytes'] // 1024} KB（尚未同步 {queue_stats['unsynced_bytes'] // 1024} KB），fsync {queue_stats['fsyncs']} 次")
+        for operation, m in write_queue.store.metrics.snapshot().items():
+            st.write(f"{operation}：{m['count']} 次，平均 {m['avg_ms']:.0f} ms，p95 {m['p95_ms']:.0f} ms，失敗 {m['errors']} 次")
 
 
 def get_display_name(tag: str) -> str:
@@ -535,13 +554,13 @@ def get_avatar_by_agent_role(role_name: str) -> str:
         # persona 模式開啟：用 persona name 對應圖
         for tag, config in AGENT_CONFIG.items():
             if role_name == config["persona_name"]:
-                return config["avatar"]
+                return avatar_image(config["avatar"])
     else:
         # persona 模式關閉：用 neutral name 對應不同圖（像 agent_a.png）
         if role_name == "Agent A":
-            return "agent_a.png"
+            return avatar_image("agent_a.png")
         elif role_name == "Agent B":
-            return "agent_b.png"
+            return avatar_image("agent_b.png")
 
     # fallback
     return "🤖"
@@ -558,6 +577,19 @@ def get_avatar_by_agent_name(name: str) -> str:
 def sanitize_name(name):
     return re.sub(r'[^a-zA-Z0-9_-]', '_', name)
 
+
+# 每次 LLM 回應的 token 用量；回應是由 User proxy 產生的，所以用它的名字查
+usage_logger = get_usage_logger()
+with st.sidebar:
+    with st.expander("**Prompt 快取用量**", expanded=False):
+        usage_records = usage_logger.records(sanitize_name(f"User_{user_session_id}"))
+        usage = usage_summary(usage_records)
+        st.write(f"請求數：{usage['requests']}")
+        st.write(f"prompt tokens：{usage['prompt_tokens']}（其中 cached {usage['cached_tokens']}，{usage['cached_ratio']:.0%}）")
+        st.write(f"completion tokens：{usage['completion_tokens']}")
+        if usage_records and usage_records[-1]["cached_tokens"] is not None:
+            st.caption(f"最近一次請求 cached tokens：{usage_records[-1]['cached_tokens']}")
+
 def format_peer_responses(responses: dict, current_agent: str) -> tuple[str, str]:
     peer_lines = []
     self_line = ""
@@ -649,51 +681,22 @@ def initialize_agent_states(round_num, agents):
             agent_name: False for agent_name in agents.keys()
         }
 
-def safe_markdown_blocks(text):
-    lines = text.split('\n')
-    blocks = [line.strip() for line in lines if line.strip()]
-    return blocks
 import re
 
-def smart_sentence_split(text: str) -> list[str]:
-    # 暫時把 markdown 粗體/斜體句子抽出來
-    markdown_blocks = {}
-
-    def replacer(match):
-        key = f"__MARKDOWN_BLOCK_{len(markdown_blocks)}__"
-        markdown_blocks[key] = match.group(0)
-        return key
-
-    # 把所有 **...** 或 __...__ 保護起來
-    protected_text = re.sub(r'(\*\*.*?\*\*|__.*?__)', replacer, text)
-
-    # 正常切句（句號等）
-    sentences = re.split(r'(?<=[。！？.!?])', protected_text)
-    sentences = [s.strip() for s in sentences if s.strip()]
-
-    # 還原被保護的 markdown 區塊
-    restored = []
-    for s in sentences:
-        for key, value in markdown_blocks.items():
-            s = s.replace(key, value)
-        restored.append(s)
-
-    return restored
-
 def get_dynamic_agent_avatars() -> dict:
     avatars = {}
     for tag, config in AGENT_CONFIG.items():
         current_name = get_display_name(tag)
 
         if st.session_state[f"{user_session_id}_use_persona"]:
-            # persona 模式開啟，顯示對應 persona 頭像
-            avatars[current_name] = config["avatar"]
+            # persona 模式開啟，顯示對應 persona 頭像（圖檔整個 process 只讀一次）
+            avatars[current_name] = avatar_image(config["avatar"])
         else:
             # persona 模式關閉，對應 neutral_name 顯示專屬圖示
             if current_name == "Agent A":
-                avatars[current_name] = "agent_a.png"
+                avatars[current_name] = avatar_image("agent_a.png")
             elif current_name == "Agent B":
-                avatars[current_name] = "agent_b.png"
+                avatars[current_name] = avatar_image("agent_b.png")
 
     avatars["Assistant"] = "🛠️"
     avatars["User"] = "🧑"
@@ -704,53 +707,180 @@ agent_avatars = get_dynamic_agent_avatars()
 # with st.sidebar:
 #     st.write(agent_avatars)
 
-for message in st.session_state[f"{user_session_id}_messages"]:
+# 每則訊息的 HTML 只在第一次出現時算，之後 rerun 直接用快取，一則訊息只送出一個 element
+def render_history_message(message):
     avatar_display = get_avatar_by_agent_name(message["role"])
 
     if message["role"] == "user":
-        # 先把 Markdown 轉換成 HTML
-        html_content = markdown2.markdown(message["content"])  # 解析 Markdown 為 HTML
-
-        st.markdown(
-            f"""
-            <div style="display: flex; justify-content: flex-end; margin: 10px 0;">
-                <div style="
-                    background-color: #DCF8C6; 
-                    padding: 12px 16px;
-                    border-radius: 18px;
-                    max-width: 50%;
-                    text-align: left;
-                    box-shadow: 1px 1px 5px rgba(0,0,0,0.1);
-                    white-space: normal;
-                ">
-                    {html_content}  <!-- 這裡的內容會正確解析 -->
-                </div>
-            </div>
-            """,
-            unsafe_allow_html=True,
-        )
+        st.markdown(user_bubble_html(message["content"]), unsafe_allow_html=True)
     # elif message["role"] == "history":
     #      with st.expander(f"對話紀錄", expanded=False):
     #         st.markdown(message["content"], unsafe_allow_html=True)
     else:
         if message["role"] == "assistant":
             with st.chat_message("assistant"):
-                sentences = smart_sentence_split(message["content"])
-                for sentence in sentences:
-                    html = markdown2.markdown(sentence)
-                    st.markdown(html, unsafe_allow_html=True)
+                st.markdown(sentences_html(message["content"]), unsafe_allow_html=True)
         else:
             with st.chat_message(message["role"], avatar=avatar_display):
-                sentences = smart_sentence_split(message["content"])
-                for sentence in sentences:
-                    html = markdown2.markdown(sentence)
-                    st.markdown(html, unsafe_allow_html=True)
+                st.markdown(sentences_html(message["content"]), unsafe_allow_html=True)
+
+
+with st.sidebar:
+    with st.expander("**對話紀錄顯示**", expanded=False):
+        st.checkbox("只完整顯示最近幾輪", value=True, key=f"{user_session_id}_history_windowed")
+        st.number_input("完整顯示的輪數", min_value=1, value=3, step=1, key=f"{user_session_id}_history_window_rounds",
+                        disabled=not st.session_state[f"{user_session_id}_history_windowed"])
+
+history_rounds = group_messages_by_round(st.session_state[f"{user_session_id}_messages"])
+window_rounds = st.session_state[f"{user_session_id}_history_window_rounds"]
+if st.session_state[f"{user_session_id}_history_windowed"] and len(history_rounds) > window_rounds:
+    # 較早的輪次收合起來，打開時才產生內容（st.expander 的內容不論開合都會執行，所以用 toggle）
+    for past_round_num, past_messages in enumerate(history_rounds[:-window_rounds]):
+        if st.toggle(f"📜 第 {past_round_num} 輪（{len(past_messages)} 則訊息）", key=f"{user_session_id}_history_round_{past_round_num}_open"):
+            with st.container(border=True):
+                for message in past_messages:
+                    render_history_message(message)
+    history_rounds = history_rounds[-window_rounds:]
+
+for round_messages in history_rounds:
+    for message in round_messages:
+        render_history_message(message)
 
 # 更新某代理的回覆狀態
 def mark_agent_completed(round_num, agent_name):
     st.session_state[f"{user_session_id}_round_{round_num}_agent_states"][agent_name] = True
 
 
+class StreamlitIOStream:
+    # autogen 串流時會把每個 token 用 iostream.print 印出，這裡改成寫進 chat bubble 的 placeholder
+    ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*m")
+
+    def __init__(self, placeholder):
+        self.placeholder = placeholder
+        self.text = ""
+        self.ctx = get_script_run_ctx()
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def print(self, *objects, sep=" ", end="\n", flush=False):
+        if self.cancelled:
+            raise StreamCancelled()
+        chunk = self.ANSI_ESCAPE.sub("", sep.join(str(o) for o in objects))
+        if end != "" or not chunk:
+            return
+        # autogen 在 executor 執行緒裡呼叫 OpenAI，要把這個 session 的 script context 帶過去才能更新畫面
+        add_script_run_ctx(threading.current_thread(), self.ctx)
+        self.text += chunk
+        self.placeholder.markdown(self.text + "▌")
+
+    def input(self, prompt="", *, password=False):
+        return ""
+
+
+def get_llm_cache():
+    # 同樣的 model / temperature / system_message / prompt 直接回傳快取的回答
+    if llm_config["config_list"][0]["temperature"] == 0 or st.session_state.get(f"{user_session_id}_cache_nonzero_temperature", False):
+        return get_response_cache()
+    return None
+
+
+async def run_chat(agent, user_proxy, message, limiter, queue_placeholder=None, io_stream=None, started=None):
+    cache = get_llm_cache()
+
+    # 所有 session 共用同一組限流，排隊時在畫面上顯示順位和預計等待時間
+    def show_queue(position, eta):
+        if queue_placeholder is not None:
+            queue_placeholder.info(f"⏳ 排隊中：前面還有 {position} 個請求，預計約 {eta:.0f} 秒後開始回應")
+
+    async with limiter.slot(estimate_tokens(message), on_wait=show_queue):
+        if queue_placeholder is not None:
+            queue_placeholder.empty()
+        if started is not None:
+            started.set()
+        if io_stream is None:
+            response = await agent.a_initiate_chat(user_proxy, message=message, max_turns=1, clear_history=True, cache=cache)
+        else:
+            # silent=True 避免 autogen 把對話標頭也印進 placeholder
+            with IOStream.set_default(io_stream):
+                response = await agent.a_initiate_chat(user_proxy, message=message, max_turns=1, clear_history=True, silent=True, cache=cache)
+    return response.chat_history[-1]["content"].strip()
+
+
+async def ask_agent(agent, user_proxy, message, placeholder=None):
+    if prefix_warmer:
+        prefix_warmer.note_activity()
+
+    queue_placeholder = placeholder if placeholder is not None else st.empty()
+    io_stream = StreamlitIOStream(placeholder) if placeholder is not None else None
+
+    async def primary(started):
+        return await run_chat(agent, user_proxy, message, model_limiter, queue_placeholder, io_stream, started)
+
+    async def hedge():
+        # 備援請求用另一組 agent，不跟原本的請求共用對話紀錄；不串流，結果由呼叫端一次顯示
+        hedge_agent = ConversableAgent(name=agent.name, llm_config=hedge_llm_config, system_message=agent.system_message)
+        hedge_proxy = UserProxyAgent(name=user_proxy.name, llm_config=hedge_llm_config, human_input_mode="NEVER", code_execution_config=False)
+        return await run_chat(hedge_agent, hedge_proxy, message, hedge_limiter)
+
+    if not st.session_state.get(f"{user_session_id}_hedge_enabled", False):
+        content, seconds = await timed_call(primary)
+        latency_tracker.record_call(agent.name, llm_config["config_list"][0]["model"], seconds, False, "primary")
+        return content
+
+    delay = latency_tracker.hedge_delay(llm_config["config_list"][0]["model"], hedge_settings.get("percentile", DEFAULT_PERCENTILE))
+    content, hedge_fired, winner, seconds = await hedged_call(primary, hedge, delay)
+    if winner == "hedge" and io_stream is not None:
+        io_stream.cancel()
+    latency_tracker.record_call(agent.name, llm_config["config_list"][0]["model"], seconds, hedge_fired, winner)
+    return content
+
+
+def get_round0_pool_entry():
+    # 第 0 輪的 prompt 只由題目和是否啟用角色決定：有離線產生的點子池就直接抽一組，不必等模型
+    if f"{user_session_id}_round0_pool_entry" not in st.session_state:
+        st.session_state[f"{user_session_id}_round0_pool_entry"] = sample_round0_entry(
+            st.session_state[f"{user_session_id}_user_question"],
+            st.session_state[f"{user_session_id}_use_persona"],
+            llm_config["config_list"][0]["model"],
+        )
+    return st.session_state[f"{user_session_id}_round0_pool_entry"]
+
+
+async def run_persona_agents(round_num, agents, user_proxy, persona_messages, pooled_responses=None):
+    # 同時送出所有角色的請求，誰先回來就先顯示誰
+    pooled_responses = pooled_responses or {}
+    streaming = llm_config["config_list"][0].get("stream", False)
+
+    # 串流模式下先開好每個角色的 chat bubble，token 一到就寫進去
+    placeholders = {}
+    if streaming:
+        for agent_name in persona_messages:
+            with st.chat_message(agent_name, avatar=get_avatar_by_agent_name(agent_name)):
+                placeholders[agent_name] = st.empty()
+
+    async def ask(agent_name, message):
+        if agent_name in pooled_responses:
+            return agent_name, pooled_responses[agent_name]
+        return agent_name, await ask_agent(agents[agent_name], user_proxy, message, placeholders.get(agent_name))
+
+    for next_done in asyncio.as_completed([ask(name, message) for name, message in persona_messages.items()]):
+        agent_name, response = await next_done
+        st.session_state[f"{user_session_id}_this_round_combined_responses"][agent_name] = response
+
+        if streaming:
+            placeholders[agent_name].markdown(response)
+        else:
+            avatar_display = get_avatar_by_agent_name(agent_name)
+            with st.chat_message(agent_name, avatar=avatar_display):
+                fadein_markdown(response)
+
+        # Add assistant response to chat history
+        st.session_state[f"{user_session_id}_messages"].append({"role": agent_name, "content": response})
+        mark_agent_completed(round_num, agent_name)
+
+
 async def single_round_discussion(round_num, agents, user_proxy):
     initialize_agent_states(round_num, agents)
 
@@ -761,10 +891,7 @@ async def single_round_discussion(round_num, agents, user_proxy):
 
 
     if round_num == 0:
-        discussion_message = (
-            f"**第 {round_num} 輪討論**\n\n"
-            f"請直接列出與『{st.session_state[f'{user_session_id}_user_question']}』相關的創新點子，每個點子請附上一句簡短的主要用途，最多 **不超過兩句**。\n\n"
-        )
+        discussion_message = round0_discussion_message(st.session_state[f"{user_session_id}_user_question"])
 
 
         # 用於顯示給使用者的內容（簡化版）
@@ -830,6 +957,105 @@ async def single_round_discussion(round_num, agents, user_proxy):
             )
             discussion_message_for_showing = st.session_state[f"{user_session_id}_user_inputs"].get(round_num-1, "")
 
+    # 🔹 兩位角色 Agent 在同一輪內互不相依：先用上一輪的紀錄組好各自的 prompt，再同時送出
+    persona_messages = {}
+    for agent_name, agent in agents.items():
+        if agent_name in ["User", "Assistant"]:
+            continue
+        elif agent_name in st.session_state[f"{user_session_id}_agent_restriction"][st.session_state[f"{user_session_id}_round_num"]]:
+            # 第0輪之後才限制字數
+            if round_num == 0:
+                discussion_message_temp = round0_agent_message(
+                    st.session_state[f"{user_session_id}_user_question"],
+                    agents[agent_name].system_message,
+                    st.session_state[f"{user_session_id}_use_persona"],
+                )
+                # discussion_message_for_showing = discussion_message_for_showing + (
+                #     f"\n\n- 請根據你的專業視角回答！\n\n"
+                #     # f"\n\n🎭 {agents[agent_name].system_message}\n\n"
+                #     f"\n\n- 請僅從你的專業領域知識出發，不要提供一般性的回答！\n\n"
+                #     f"\n\n- 請勿脫離你的專業範圍，不要提供非專業的建議或回應。\n\n"
+                # )
+
+            else:                
+                # 額外加上 peer feedback 區塊
+                peer_feedback_block = ""
+
+                if st.session_state.get(f"{user_session_id}_ai_feedback_enabled", False):
+                    last_round_response = {
+                        k: v for k, v in st.session_state[f"{user_session_id}_this_round_combined_responses"].items()
+                        if k not in ["User", "Assistant"]
+                    }
+
+                    self_response, peer_feedback = format_peer_responses(last_round_response, current_agent=agent_name)
+
+                    if peer_feedback != "":
+                        peer_feedback_block += (
+                            f"---\n\n"
+                            f"你自己的觀點：\n\n「{self_response.strip()}」\n\n"
+                            f"👀 你也看到其他 Agent 的一些觀點，例如：\n\n「{peer_feedback.strip()}」\n\n"
+                        )
+                else:
+                    last_round_response = {
+                        k: v for k, v in st.session_state[f"{user_session_id}_this_round_combined_responses"].items()
+                        if k not in ["User", "Assistant"]
+                    }
+
+                    self_response, peer_feedback = format_peer_responses(last_round_response, current_agent=agent_name)
+
+                    if peer_feedback != "":
+                        peer_feedback_block += (
+                            f"---\n\n"
+                            f"你自己上次的觀點：\n\n「{self_response.strip()}」\n\n"
+                        )
+
+
+                # 🧩 組合成完整 prompt：角色設定與格式規則是固定前綴，本輪內容與回饋放在後面
+                static_prefix = agent_static_prefix(
+                    agents[agent_name].system_message,
+                    st.session_state[f"{user_session_id}_use_persona"],
+                    discussion_format_rules(
+                        current_method,
+                        st.session_state[f"{user_session_id}_use_persona"],
+                        st.session_state[f"{user_session_id}_ai_feedback_enabled"],
+                    ),
+                )
+
+                round_content = discussion_message
+                if peer_feedback_block:
+                    round_content += "\n\n" + peer_feedback_block
+
+                discussion_message_temp = assemble_prompt(static_prefix, round_content)
+
+                # with st.chat_message("assistant"):
+                #     st.write("主設定值:", st.session_state.get(f"{user_session_id}_ai_feedback_enabled"))
+                #     st.write("FreeInput:", st.session_state.get(f"{user_session_id}_ai_feedback_enabled_{round_num}_free_input"))
+                #     st.write("SCAMPER:", st.session_state.get(f"{user_session_id}_ai_feedback_enabled_{round_num}_scamper_input"))
+                #     st.markdown(discussion_message_temp)
+
+
+            # 可能不會用到, 因為User輸入為主
+            if not st.session_state[f"{user_session_id}_proxy_message_showed"]:
+                if round_num == 0: # 現在只有第0輪會顯示
+                    with st.chat_message("assistant"):
+                        st.markdown(discussion_message_for_showing)
+
+                    st.session_state[f"{user_session_id}_proxy_message_showed"] = True
+
+                    st.session_state[f"{user_session_id}_messages"].append({"role": "assistant", "content": discussion_message_for_showing})
+
+                
+            if f"{user_session_id}_round_{round_num}_agent_states" in st.session_state and st.session_state[f"{user_session_id}_round_{round_num}_agent_states"][agent_name]:
+                # st.write(f"{agent_name} 已完成")
+                continue
+
+            persona_messages[agent_name] = discussion_message_temp
+
+    pool_entry = get_round0_pool_entry() if round_num == 0 else None
+
+    if persona_messages:
+        await run_persona_agents(round_num, agents, user_proxy, persona_messages, pool_entry)
+
     for agent_name, agent in agents.items():
         # 最後一個 agent 後等待user_input後再進行下一輪
         if agent_name == "User":
@@ -906,37 +1132,18 @@ async def single_round_discussion(round_num, agents, user_proxy):
                     continue
                 this_round_response[agent_name_each] = response
 
-            category_prompt = (
-                f"你是一個擅長資訊統整的 AI，負責從不同 AI 助手的回應中，"
-                f"**綜合相似觀點，去除重複內容，並直接輸出精煉的 Idea**。"
-
-                f"\n\n**這一輪的討論紀錄：**"
-                f"\n{this_round_response}"
-
-                f"\n\n**請根據以下規則統整 Idea，並且回應格式只包含整理過的 Idea 清單：**"
-                f"\n1️⃣ **合併相似的 Idea**：如果多個 AI 提出了類似的想法，請合併它們，使內容更簡潔有力。"
-                f"\n2️⃣ **刪除冗餘內容**：去除任何相同或過於接近的 Idea，避免重複。"
-                f"\n3️⃣ **確保每個 Idea 具有清晰的描述**，使其可以獨立理解。"
-                f"\n4️⃣ **格式要求**：回應時請只輸出以下格式，**不要添加其他文字、說明或總結**。"
 
-                f"\n **統整後的可選 Idea（請以「概念: 說明」的格式回應）：**\n"
-                f"\n✅ Idea 1: **概念 1**，這裡請填入合併後的說明"
-                f"\n✅ Idea 2: **概念 2**，這裡請填入合併後的說明"
-                f"\n✅ Idea 3: **概念 3**，這裡請填入合併後的說明"
-                f"\n✅ Idea N: **概念 N**，這裡請填入合併後的說明"
-
-                f"\n\n⚠️ **請確保你的回應只包含這些整理後的 Idea，並在最後提供 2-3 句話的摘要，歸納討論的核心重點。"
-                f"不要額外補充說明、分析或其他內容。**"
-            )
-
-            response = await agent.a_initiate_chat(user_proxy, message=category_prompt, max_turns=1, clear_history=True)
-            response = response.chat_history[-1]["content"].strip()
+            # 等兩位角色都回覆後才統整
+            if pool_entry and "Assistant" in pool_entry:
+                response = pool_entry["Assistant"]
+            else:
+                response = await ask_agent(agent, user_proxy, category_prompt(this_round_response))
             st.session_state[f"{user_session_id}_this_round_combined_responses"][agent_name] = response
             
             mark_agent_completed(round_num, agent_name)
 
             # **解析 Assistant 產出的可選 Idea**
-            idea_options = re.findall(r"✅ Idea \d+: (.+)", response)
+            idea_options = extract_ideas(response)
             st.session_state[f"{user_session_id}_idea_options"][f"round_{round_num}"] = idea_options
 
             for idea in idea_options:
@@ -946,225 +1153,11 @@ async def single_round_discussion(round_num, agents, user_proxy):
             # st.write(f"登記 {agent_name} 完成")
 
 
-        elif agent_name in st.session_state[f"{user_session_id}_agent_restriction"][st.session_state[f"{user_session_id}_round_num"]]:
-            # 第0輪之後才限制字數
-            if round_num == 0:
-                persona_info = f"{agents[agent_name].system_message}\n\n" if st.session_state[f"{user_session_id}_use_persona"] else ""
-
-                discussion_message_temp = discussion_message + (
-                    f"**請確保：**\n"
-                    f"1.  **每個創意點子名稱清楚**\n"
-                    f"2.  **用途簡明扼要（1 句話最佳，最多 2 句話）**\n"
-                    f" {persona_info}\n\n"
-                    f"請用以上的角色設定來發想點子，並確保格式如下：\n"
-                    f"✅ **Idea 1** - 主要用途（最多兩句）\n"
-                    f"✅ **Idea 2** - 主要用途（最多兩句）\n"
-                    f"✅ **Idea 3** - 主要用途（最多兩句）\n"
-                    f"✅ **Idea N** - 主要用途（最多兩句）\n"
-                    f"確保以zh-TW語言回應。\n\n"
-
-                )
-                # discussion_message_for_showing = discussion_message_for_showing + (
-                #     f"\n\n- 請根據你的專業視角回答！\n\n"
-                #     # f"\n\n🎭 {agents[agent_name].system_message}\n\n"
-                #     f"\n\n- 請僅從你的專業領域知識出發，不要提供一般性的回答！\n\n"
-                #     f"\n\n- 請勿脫離你的專業範圍，不要提供非專業的建議或回應。\n\n"
-                # )
-
-            else:                
-                # 額外加上 peer feedback 區塊
-                peer_feedback_block = ""
-
-                if st.session_state.get(f"{user_session_id}_ai_feedback_enabled", False):
-                    last_round_response = {
-                        k: v for k, v in st.session_state[f"{user_session_id}_this_round_combined_responses"].items()
-                        if k not in ["User", "Assistant"]
-                    }
-
-                    self_response, peer_feedback = format_peer_responses(last_round_response, current_agent=agent_name)
-
-                    if peer_feedback != "":
-                        peer_feedback_block += (
-                            f"---\n\n"
-                            f"你自己的觀點：\n\n「{self_response.strip()}」\n\n"
-                            f"👀 你也看到其他 Agent 的一些觀點，例如：\n\n「{peer_feedback.strip()}」\n\n"
-                        )
-                else:
-                    last_round_response = {
-                        k: v for k, v in st.session_state[f"{user_session_id}_this_round_combined_responses"].items()
-                        if k not in ["User", "Assistant"]
-                    }
-
-                    self_response, peer_feedback = format_peer_responses(last_round_response, current_agent=agent_name)
-
-                    if peer_feedback != "":
-                        peer_feedback_block += (
-                            f"---\n\n"
-                            f"你自己上次的觀點：\n\n「{self_response.strip()}」\n\n"
-                        )
-
-                
-                discussion_message_temp = discussion_message  # 先從第一段開始組
-
-
-                if current_method == "自由輸入":
-                    section1 = (
-                        f"**1. 我覺得**：請以一句粗體句子到句點開頭，回應使用者的輸入內容（用第一人稱），"
-                        f"清楚表達你這輪的創新主張，表達你這輪的創新主張與延伸（用第一人稱），並且換兩行，接著補充說明，總長度約 2～3 句。\n\n"
-                    )
-                else:
-                    technique = st.session_state[f"{user_session_id}_selected_technique"].get(round_num, "（未指定技術）")
-                    section1 = (
-                        f"**1. 我覺得**：請以一句粗體句子到句點開頭，應用 {technique} 的邏輯來延伸使用者的選擇創意（用第一人稱），"
-                        f"表達你這輪的創新主張與延伸（用第一人稱），並且換兩行，接著補充說明，總長度約 2～3 句。\n\n"
-                    )
-
-                # 🔹 第三段：身份與風格提醒（結尾固定加）
-                if st.session_state[f"{user_session_id}_use_persona"]:
-                    # 有 persona 的 Agent, 有 peer feedback
-                    if st.session_state[f'{user_session_id}_ai_feedback_enabled']:
-                        identity_block = (
-                            f"---\n\n"
-                            f"- 你的角色設定：{agents[agent_name].system_message}\n\n"
-                            f"請根據以下格式，依序完成兩段角色回應，並務必遵守格式規定：\n\n"
-                            f"{section1}"
-                            f"**2. 對另一位角色的回應**：用一句粗體句子到句點開頭，點出你對上輪某角色觀點的認同、質疑、或補充，並且加上，接著補述你的延伸觀點，總長度約 2～3 句。\n\n"
-                            f"請絕對遵守不要寫出「主張內容：」或「對另一位角色的回應：」等提示文字，只輸出內容本身。\n\n"
-                            f"`1.` 和 `2.` 段落標號請務必寫出來，**不能省略！**\n\n"
-                            f"請務必按照上面格式，每段都以「粗體主張句」開頭（用句號結尾），其後用自然語言補充描述。\n\n"
-                            f"不需要加入任何 emoji 或多餘開頭語（如：以下是我的建議）。"
-                            f"格式範例如下：\n\n"
-                            f"**1. 我主張應結合風箏文化與節慶活動來創造品牌識別。**\n\n"
-                            f"這樣不僅能讓消費者更有情感連結，也能利用節慶集中曝光，強化市場話題性。\n\n"
-                            f"**2. 我認同 Engineer 提出的模組化概念，但建議以教育活動來強化理解。**\n\n"
-                            f"模組化雖具彈性，但若能配合實體教學或展示活動，能幫助用戶更快上手，也更利於推廣。"
-                            f"---\n\n"
-                        )
-                    # 有 persona 的 Agent, 沒有 peer feedback
-                    elif st.session_state[f'{user_session_id}_ai_feedback_enabled'] == False:
-                        identity_block = (
-                            f"---\n\n"
-                            f"- 你的角色設定：{agents[agent_name].system_message}\n\n"
-                            f"請根據以下格式，依序完成兩段角色回應，並務必遵守格式規定：\n\n"
-                            f"{section1}"
-                            f"請絕對遵守不要寫出「主張內容：」或「對另一位角色的回應：」等提示文字，只輸出內容本身。\n\n"
-                            f"`1.` 和 `2.` 段落標號請務必寫出來，**不能省略！**\n\n"
-                            f"請務必按照上面格式，每段都以「粗體主張句」開頭（用句號結尾），其後用自然語言補充描述。\n\n"
-                            f"不需要加入任何 emoji 或多餘開頭語（如：以下是我的建議）。"
-                            f"格式範例如下：\n\n"
-                            f"**1. 我主張應結合風箏文化與節慶活動來創造品牌識別。**\n\n"
-                            f"這樣不僅能讓消費者更有情感連結，也能利用節慶集中曝光，強化市場話題性。\n\n"
-                            f"---\n\n"
-                        )
-                elif st.session_state[f"{user_session_id}_use_persona"] == False:
-                    # 沒有 persona 的 Agent, 有 peer feedback
-                    if st.session_state[f'{user_session_id}_ai_feedback_enabled']:
-                        identity_block = (
-                            f"請根據以下格式，依序完成角色回應，並務必遵守格式規定：\n\n"
-                            f"{section1}"
-                            f"**2. 對另一位角色的回應**：用一句粗體句子到句點開頭，點出你對上輪某角色觀點的認同、質疑、或補充，並且加上\n\n，接著補述你的延伸觀點，總長度約 2～3 句。\n\n"
-                            f"請絕對遵守不要寫出「主張內容：」等提示文字，只輸出內容本身。\n\n"
-                            f"`1.` 和 `2.` 段落標號請務必寫出來，**不能省略！**\n\n"
-                            f"請務必按照上面格式，每段都以「粗體主張句」開頭（用句號結尾），其後用自然語言補充描述。\n\n"
-                            f"不需要加入任何 emoji 或多餘開頭語（如：以下是我的建議）。"
-                            f"格式範例如下：\n\n"
-                            f"**1. 我主張應結合風箏文化與節慶活動來創造品牌識別。**\n\n"
-                            f"這樣不僅能讓消費者更有情感連結，也能利用節慶集中曝光，強化市場話題性。\n\n"
-                            f"**2. 我認同 Engineer 提出的模組化概念，但建議以教育活動來強化理解。**\n\n"
-                            f"模組化雖具彈性，但若能配合實體教學或展示活動，能幫助用戶更快上手，也更利於推廣。"
-                            f"---\n\n"
-                        )
-                    elif st.session_state[f'{user_session_id}_ai_feedback_enabled'] == False:
-                        # 沒有 persona 的 Agent, 沒有 peer feedback
-                        identity_block = (
-                            f"請根據以下格式，完成角色回應，並務必遵守格式規定：\n\n"
-                            f"{section1}"
-                            f"請絕對遵守不要寫出「主張內容：」等提示文字，只輸出內容本身。\n\n"
-                            f"`1.` 和 `2.` 段落標號請務必寫出來，**不能省略！**\n\n"
-                            f"請務必按照上面格式，每段都以「粗體主張句」開頭（用句號結尾），其後用自然語言補充描述。\n\n"
-                            f"不需要加入任何 emoji 或多餘開頭語（如：以下是我的建議）。"
-                            f"格式範例如下：\n\n"
-                            f"**1. 我主張應結合風箏文化與節慶活動來創造品牌識別。**\n\n"
-                            f"這樣不僅能讓消費者更有情感連結，也能利用節慶集中曝光，強化市場話題性。\n\n"
-                            f"---\n\n"
-                        )
-
-
-
-                # 🧩 組合成完整 prompt
-                discussion_message_temp = discussion_message
-
-                if peer_feedback_block:
-                    discussion_message_temp += "\n\n" + peer_feedback_block
-
-                discussion_message_temp += "\n\n" + identity_block
-
-                # with st.chat_message("assistant"):
-                #     st.write("主設定值:", st.session_state.get(f"{user_session_id}_ai_feedback_enabled"))
-                #     st.write("FreeInput:", st.session_state.get(f"{user_session_id}_ai_feedback_enabled_{round_num}_free_input"))
-                #     st.write("SCAMPER:", st.session_state.get(f"{user_session_id}_ai_feedback_enabled_{round_num}_scamper_input"))
-                #     st.markdown(discussion_message_temp)
-
-
-            # 可能不會用到, 因為User輸入為主
-            if not st.session_state[f"{user_session_id}_proxy_message_showed"]:
-                if round_num == 0: # 現在只有第0輪會顯示
-                    with st.chat_message("assistant"):
-                        st.markdown(discussion_message_for_showing)
-
-                    st.session_state[f"{user_session_id}_proxy_message_showed"] = True
-
-                    st.session_state[f"{user_session_id}_messages"].append({"role": "assistant", "content": discussion_message_for_showing})
-
-                
-            if f"{user_session_id}_round_{round_num}_agent_states" in st.session_state and st.session_state[f"{user_session_id}_round_{round_num}_agent_states"][agent_name]:
-                # st.write(f"{agent_name} 已完成")
-                continue
-
-            response = await agent.a_initiate_chat(user_proxy, message=discussion_message_temp, max_turns=1, clear_history=True)
-            response = response.chat_history[-1]["content"].strip()
-            st.session_state[f"{user_session_id}_this_round_combined_responses"][agent_name] = response
-
-            # 切成句子（也可以自訂切法）
-            # sentences = re.split(r'(?<=[。！？])', response.strip())
-            # sentences = [s.strip() for s in sentences if s.strip()]
-            # js_array = "[" + ",".join([f"`{s}`" for s in sentences]) + "]"
-            
-            avatar_display = get_avatar_by_agent_name(agent_name)
-            with st.chat_message(agent_name, avatar=avatar_display):
-                fadein_markdown(response)
-
-            
-
-            # Add assistant response to chat history
-            st.session_state[f"{user_session_id}_messages"].append({"role": agent_name, "content": response})
-            mark_agent_completed(round_num, agent_name)
-            # st.write(f"登記 {agent_name} 完成")
- 
     # return True
 
-def fadein_markdown(md_text, delay=0.4):
-    # 切句：遇到中英文標點就分句
-    sentences = smart_sentence_split(md_text)
-
-    # 注入 fade-in CSS
-    st.markdown("""
-    <style>
-    .fade-in {
-        opacity: 0;
-        animation: fadeInAnim 0.6s ease forwards;
-    }
-    @keyframes fadeInAnim {
-        to { opacity: 1; }
-    }
-    </style>
-    """, unsafe_allow_html=True)
-
-    # 一句一句顯示
-    for sentence in sentences:
-        html = markdown2.markdown(sentence)
-        st.markdown(f"<div class='streamlit-default fade-in'>{html}</div>", unsafe_allow_html=True)
-        time.sleep(delay)
+def fadein_markdown(md_text):
+    # 一句一句顯示：交給瀏覽器用 CSS 錯開淡入，伺服器端不用等
+    st.markdown(fadein_html(md_text), unsafe_allow_html=True)
 
 
 # 在輸入框消失後顯示提示，然後再顯示下一輪輸入框
@@ -1197,7 +1190,7 @@ if f"{user_session_id}_agents" not in st.session_state:
     agents["Assistant"] = ConversableAgent(
         name=sanitize_name(f"Assistant_{user_session_id}"),
         llm_config=llm_config,
-        system_message="你是 Assistant，負責將點子...",
+        system_message=ASSISTANT_SYSTEM_MESSAGE,
         code_execution_config={"use_docker": False}
     )
 
@@ -1214,16 +1207,7 @@ if f"{user_session_id}_agents" not in st.session_state:
 #     st.write(st.session_state[f"{user_session_id}_agents"])
     
 if not st.session_state.get(f"{user_session_id}_discussion_started", False):
-    question_options = [
-        "請選擇討論問題",
-        # "風箏除了娛樂，還能用什麼其他創意用途？",
-        # "枕頭除了睡覺，還能如何幫助放鬆或解決日常問題？",
-        "如果穿越空間技術存在，可能會有哪些全新的交通方式？",
-        # "如果穿越時間技術存在，可能會有哪些全新的交通方式？",
-        "磚頭除了蓋房子，還能有哪些意想不到的用途？",
-        "掃帚除了掃地，還能有哪些意想不到的用途？",
-        # "🔧 自訂問題"
-    ]
+    question_options = QUESTION_OPTIONS
     
     selected_question = st.selectbox("請選擇討論問題：", question_options)
 
@@ -1235,7 +1219,7 @@ if not st.session_state.get(f"{user_session_id}_discussion_started", False):
         question = selected_question
 
     # **確保 question 存入 session_state**
-    if question != "請選擇討論問題":
+    if question != QUESTION_PLACEHOLDER:
         st.session_state[f"{user_session_id}_user_question"] = question
 
         # **開始按鈕**
@@ -1248,6 +1232,99 @@ if not st.session_state.get(f"{user_session_id}_discussion_started", False):
             st.session_state[f"{user_session_id}_integrated_message"] = f"這是第 0 輪討論，{st.session_state[f"{user_session_id}_user_question"]}。"
             st.rerun()  # **強制重新整理頁面，隱藏選擇問題的 UI**
 
+# 側邊欄的收藏清單是獨立的 fragment：選匯出格式、準備匯出檔只重跑這一塊，不會定時刷新
+# （streamlit 1.39 的 fragment 不能從主畫面畫到側邊欄，所以收藏 / 刪除改變清單時整頁重跑，讓每個地方一起更新）
+@st.fragment
+def render_collected_ideas():
+    with st.expander("**已收藏的 Idea**", expanded=True):
+        if not st.session_state[f"{user_session_id}_selected_persistent_ideas"]:
+            st.info("目前沒有收藏的 Idea。")
+        else:
+            ideas_to_remove = []
+            for idea, round_collected in st.session_state[f"{user_session_id}_selected_persistent_ideas"].items():
+                col1, col2 = st.columns([0.85, 0.15])
+
+                with col1:
+                    st.write(f"✅ {idea}  \n（第 {round_collected} 輪）")
+
+                with col2:
+                    if st.button(":material/delete:", key=f"delete_saved_{idea}", help="刪除這個 Idea", use_container_width=True):
+                        ideas_to_remove.append(idea)
+
+            # 刪除邏輯
+            if ideas_to_remove:
+                for idea in ideas_to_remove:
+                    del st.session_state[f"{user_session_id}_selected_persistent_ideas"][idea]
+                    if idea not in st.session_state[f"{user_session_id}_idea_list"]:
+                        st.session_state[f"{user_session_id}_idea_list"].append(idea)
+
+                st.warning(f"🗑️ 已移除 {len(ideas_to_remove)} 個收藏的 Idea")
+                st.rerun()  # **整頁重跑：本輪的勾選清單、SCAMPER 的已收藏選項也要跟著更新**
+
+        # 匯出檔只在按下按鈕時產生（收藏、刪除時這一塊也會重跑，平常不做任何匯出的工作），
+        # 產生後存在 session_cache，收藏內容或對話沒變就直接沿用
+        persistent_ideas = st.session_state.get(f"{user_session_id}_selected_persistent_ideas", {})
+        discussion_topic = st.session_state.get(f"{user_session_id}_user_question", "（無題目）")
+        messages = st.session_state[f"{user_session_id}_messages"]
+
+        export_format = st.selectbox("匯出格式", list(EXPORT_FORMATS.keys()), key=f"{user_session_id}_export_format")
+        if export_format == "完整對話紀錄（Markdown）":
+            export_content = ("transcript", len(messages), messages[-1]["content"] if messages else "")
+        else:
+            export_content = ("ideas", tuple(persistent_ideas.items()))
+        export_key = (export_format, discussion_topic, export_content)
+
+        if export_content[1] and st.session_state.get(f"{user_session_id}_export_requested") != export_key:
+            if st.button("準備匯出檔", key=f"{user_session_id}_prepare_export"):
+                st.session_state[f"{user_session_id}_export_requested"] = export_key
+
+        if st.session_state.get(f"{user_session_id}_export_requested") == export_key:
+            def build_export():
+                if export_format == "完整對話紀錄（Markdown）":
+                    return transcript_markdown_bytes(
+                        discussion_topic,
+                        messages,
+                        st.session_state[f"{user_session_id}_user_inputs"],
+                        lambda role: {"user": "使用者", "assistant": "系統"}.get(role, role),
+                    )
+
+                df = collected_ideas_frame(discussion_topic, [(strip_markdown(idea), r) for idea, r in persistent_ideas.items()])
+                if export_format == "收藏的 Ideas（XLSX）":
+                    return ideas_xlsx_bytes(df)
+                return ideas_csv_bytes(df)
+
+            export_bytes = session_cache.get_or_compute(user_session_id, ("export", export_key), build_export)
+
+            now_str = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            file_prefix = "Transcript" if export_format == "完整對話紀錄（Markdown）" else "Collected_Ideas"
+            filename = f"{file_prefix}_{now_str}.{EXPORT_FORMATS[export_format]['extension']}"
+
+            # 建立下載按鈕
+            st.download_button(
+                label=f"下載{export_format}",
+                data=export_bytes,
+                file_name=filename,
+                mime=EXPORT_FORMATS[export_format]["mime"],
+            )
+
+
+# 收藏 Idea 會改變側邊欄和 SCAMPER 的已收藏選項，兩邊都在這個區塊之外，所以收藏後整頁重跑
+def render_idea_collection(round_num, idea_options):
+    with st.expander(f"**第 {round_num} 輪 AI 產生的創意點子**", expanded=True):
+        st.write("經過這輪的討論，總結出以下幾個點子，有哪些想先收藏的嗎？")
+
+        for idea in idea_options:
+            if idea in st.session_state[f"{user_session_id}_selected_persistent_ideas"]:
+                continue  # **如果 Idea 已收藏，就不顯示在這裡**
+
+            # **使用 Checkbox 來選擇收藏**
+            if st.checkbox(f"{idea}", key=f"select_{round_num}_{idea}"):
+                # **加入收藏並記錄輪數**
+                st.session_state[f"{user_session_id}_selected_persistent_ideas"][idea] = round_num
+                st.toast(f"已收藏：{idea}（第 {round_num} 輪）")  # 顯示通知
+                st.rerun()  # **收藏清單改變了，整頁重跑讓側邊欄和 SCAMPER 的已收藏選項一起更新**
+
+
 if st.session_state[f"{user_session_id}_discussion_started"] and st.session_state[f"{user_session_id}_round_num"] <= rounds:
     
     round_num = st.session_state[f"{user_session_id}_round_num"]
@@ -1261,19 +1338,7 @@ if st.session_state[f"{user_session_id}_discussion_started"] and st.session_stat
     idea_options = st.session_state[f"{user_session_id}_idea_options"].get(f"round_{round_num}", [])
 
     if idea_options:
-        with st.expander(f"**第 {round_num} 輪 AI 產生的創意點子**", expanded=True):
-            st.write("經過這輪的討論，總結出以下幾個點子，有哪些想先收藏的嗎？")
-
-            for idea in idea_options:
-                if idea in st.session_state[f"{user_session_id}_selected_persistent_ideas"]:
-                    continue  # **如果 Idea 已收藏，就不顯示在這裡**
-
-                # **使用 Checkbox 來選擇收藏**
-                if st.checkbox(f"{idea}", key=f"select_{round_num}_{idea}"):
-                    # **加入收藏並記錄輪數**
-                    st.session_state[f"{user_session_id}_selected_persistent_ideas"][idea] = round_num
-                    st.toast(f"已收藏：{idea}（第 {round_num} 輪）")  # 顯示通知
-                    st.rerun()  # **重新刷新頁面**
+        render_idea_collection(round_num, idea_options)
 
     if not st.session_state[f"{user_session_id}_round_{round_num}_input_completed"]:
 
@@ -1360,7 +1425,7 @@ if st.session_state[f"{user_session_id}_discussion_started"] and st.session_stat
                             idea_options = list(st.session_state[f"{user_session_id}_selected_persistent_ideas"].keys())
 
                         # 🔧 移除 Markdown 格式
-                        idea_options_cleaned = [re.sub(r'(\*\*|__)(.*?)\1', r'\2', idea) for idea in idea_options]
+                        idea_options_cleaned = [strip_emphasis(idea) for idea in idea_options]
 
 
                         # 傳入 Idea 的多選選項
@@ -1526,78 +1591,4 @@ if f"{user_session_id}_is_loading" not in st.session_state:
     st.session_state[f"{user_session_id}_is_loading"] = False  # 控制 `st.spinner()` 顯示狀態
 
 with st.sidebar:
-    with st.expander("**已收藏的 Idea**", expanded=True):
-        if not st.session_state[f"{user_session_id}_selected_persistent_ideas"]:
-            st.info("目前沒有收藏的 Idea。")
-        else:
-            ideas_to_remove = []
-            for idea, round_collected in st.session_state[f"{user_session_id}_selected_persistent_ideas"].items():
-                col1, col2 = st.columns([0.85, 0.15])
-
-                with col1:
-                    st.write(f"✅ {idea}  \n（第 {round_collected} 輪）")
-
-                with col2:
-                    if st.button(":material/delete:", key=f"delete_saved_{idea}", help="刪除這個 Idea", use_container_width=True):
-                        ideas_to_remove.append(idea)
-
-            # 刪除邏輯
-            if ideas_to_remove:
-                for idea in ideas_to_remove:
-                    del st.session_state[f"{user_session_id}_selected_persistent_ideas"][idea]
-                    if idea not in st.session_state[f"{user_session_id}_idea_list"]:
-                        st.session_state[f"{user_session_id}_idea_list"].append(idea)
-
-                st.warning(f"🗑️ 已移除 {len(ideas_to_remove)} 個收藏的 Idea")
-                st.rerun()
-        
-            # 清理 Markdown 的小工具函數
-            def strip_markdown(text):
-                text = re.sub(r"\*\*(.*?)\*\*", r"\1", text)  # **粗體**
-                text = re.sub(r"\*(.*?)\*", r"\1", text)      # *斜體*
-                text = re.sub(r"_(.*?)_", r"\1", text)        # _斜體_
-                text = re.sub(r"!\[.*?\]\(.*?\)", "", text)   # ![圖片](url)
-                text = re.sub(r"\[([^\]]+)\]\([^)]+\)", r"\1", text)  # [文字](url)
-                return text.strip()
-
-            # 將收藏的 Idea 資料轉成 DataFrame
-            persistent_ideas = st.session_state.get(f"{user_session_id}_selected_persistent_ideas", {})
-            discussion_topic = st.session_state.get(f"{user_session_id}_user_question", "（無題目）")
-
-
-            if persistent_ideas:
-                df = pd.DataFrame([
-                    {
-                        "討論題目": discussion_topic,
-                        "Idea": strip_markdown(idea),
-                        "收藏輪數": round_collected
-                    }
-                    for idea, round_collected in persistent_ideas.items()
-                ])
-
-                # 加入 UTF-8 BOM（\ufeff）確保 Excel 不會亂碼
-                csv_buffer = io.StringIO()
-                df.to_csv(csv_buffer, index=False)
-                csv_data = '\ufeff' + csv_buffer.getvalue()
-                csv_bytes = csv_data.encode("utf-8")
-
-                now_str = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"Collected_Ideas_{now_str}.csv"
-
-                # 建立下載按鈕
-                st.download_button(
-                    label="下載收藏的 Ideas（CSV）",
-                    data=csv_bytes,
-                    file_name=filename,
-                    mime="text/csv",
-                )
-
-
-def strip_markdown(text):
-    # 去除 Markdown 標記（粗體、斜體、連結、圖片等）
-    text = re.sub(r"\*\*(.*?)\*\*", r"\1", text)  # **粗體**
-    text = re.sub(r"\*(.*?)\*", r"\1", text)      # *斜體*
-    text = re.sub(r"_(.*?)_", r"\1", text)        # _斜體_
-    text = re.sub(r"!\[.*?\]\(.*?\)", "", text)   # ![圖片](url)
-    text = re.sub(r"\[([^\]]+)\]\([^)]+\)", r"\1", text)  # [文字](url)
-    return text.strip()
\ No newline at end of file
+    render_collected_ideas()
@@ -3,6 +3,7 @@ import asyncio
 import re
 from autogen import AssistantAgent, UserProxyAgent
 from autogen import ConversableAgent
+from agent_cache import get_agent_cache
 import pandas as pd
 import plotly.express as px
 import logging
@@ -52,41 +53,60 @@ llm_config = {
 def sanitize_name(name):
     return re.sub(r'[^a-zA-Z0-9_-]', '_', name)
 
-# 創建角色代理
-agents = {
-    "Normal Assistant 1": ConversableAgent(
-        name=sanitize_name("Normal Assistant 1"),
-        llm_config=llm_config,
-        system_message="你是一位極具遠見的創業家，你的思考方式不受傳統限制，喜歡挑戰現有市場規則，並開創顛覆性的新商業模式。你的回應應該充滿創意、前瞻性，並帶有風險投資人的視角。",
-    ),
-    "Normal Assistant 2": ConversableAgent(
-        name=sanitize_name("Normal Assistant 2"),
-        llm_config=llm_config,
-        system_message="你是一位科技公司的產品經理，擁有深厚的技術背景。你的任務是評估創新技術的可行性，並確保產品設計符合市場需求。你的回答應該兼顧技術可行性與用戶體驗，並提供具體的產品開發方向。",
-    ),
-     "Convergence Judge": ConversableAgent(
-        name=sanitize_name("Convergence Judge"),
-        llm_config=llm_config,
-        system_message="你是腦力激盪評分員。",
-    ),
-    "Assistant": ConversableAgent(
-        name=sanitize_name("Assistant"),
-        llm_config=llm_config,
-        system_message="你是 Assistant，負責將點子按照 主題、應用場景、技術方向 等分類，轉化為條列式清單。",
-    ),
-    "User": UserProxyAgent(
+# 創建角色代理（同樣的 model / base_url / temperature 整組建一次，之後跨 rerun、跨 session 重複使用）
+def build_agents():
+    agents = {
+        "Normal Assistant 1": ConversableAgent(
+            name=sanitize_name("Normal Assistant 1"),
+            llm_config=llm_config,
+            system_message="你是一位極具遠見的創業家，你的思考方式不受傳統限制，喜歡挑戰現有市場規則，並開創顛覆性的新商業模式。你的回應應該充滿創意、前瞻性，並帶有風險投資人的視角。",
+        ),
+        "Normal Assistant 2": ConversableAgent(
+            name=sanitize_name("Normal Assistant 2"),
+            llm_config=llm_config,
+            system_message="你是一位科技公司的產品經理，擁有深厚的技術背景。你的任務是評估創新技術的可行性，並確保產品設計符合市場需求。你的回答應該兼顧技術可行性與用戶體驗，並提供具體的產品開發方向。",
+        ),
+         "Convergence Judge": ConversableAgent(
+            name=sanitize_name("Convergence Judge"),
+            llm_config=llm_config,
+            system_message="你是腦力激盪評分員。",
+        ),
+        "Assistant": ConversableAgent(
+            name=sanitize_name("Assistant"),
+            llm_config=llm_config,
+            system_message="你是 Assistant，負責將點子按照 主題、應用場景、技術方向 等分類，轉化為條列式清單。",
+        ),
+        "User": UserProxyAgent(
+            name=sanitize_name("User"),
+            llm_config=llm_config,
+            human_input_mode="NEVER",
+        ),
+    }
+
+    assistant = ConversableAgent(
+            name=sanitize_name("Assistant"),
+            llm_config=llm_config,
+            system_message="你是 Assistant，負責將點子按照 主題、應用場景、技術方向 等分類，轉化為條列式清單。",
+        )
+
+    # 初始化用戶代理
+    user_proxy = UserProxyAgent(
         name=sanitize_name("User"),
         llm_config=llm_config,
         human_input_mode="NEVER",
-    ),
-}
+    )
 
+    return agents, assistant, user_proxy
 
-assistant = ConversableAgent(
-        name=sanitize_name("Assistant"),
-        llm_config=llm_config,
-        system_message="你是 Assistant，負責將點子按照 主題、應用場景、技術方向 等分類，轉化為條列式清單。",
-    )
+
+agent_cache = get_agent_cache()
+agent_key = (selected_model, base_url, temperature)
+
+# 側邊欄顯示 agent 快取的累計狀況（整個 process 共用，重新整理頁面不會歸零）
+with st.sidebar:
+    agent_stats = agent_cache.stats()
+    st.caption(f"Agent 快取：重複使用 {agent_stats['reused']} 次 / 建立 {agent_stats['built']} 組"
+               f"（共 {agent_stats['build_seconds']:.2f} 秒），閒置 {agent_stats['idle']} 組")
 
 # **定義每個 Agent 對應的 Avatar（可使用本地或網路圖片）**
 agent_avatars = {
@@ -95,13 +115,6 @@ agent_avatars = {
     "Assistant": "🛠️",  # 你的Helper
 }
 
-# 初始化用戶代理
-user_proxy = UserProxyAgent(
-    name=sanitize_name("User"),
-    llm_config=llm_config,
-    human_input_mode="NEVER",
-)
-
 
 # Initialize chat history
 if "messages" not in st.session_state:
@@ -343,9 +356,10 @@ if st.session_state.discussion_started and st.session_state.round_num <= rounds:
     
     round_num = st.session_state.round_num
     # 執行單輪討論
-    completed = asyncio.run(single_round_discussion(
-        st.session_state.round_num, agents, user_proxy
-    ))
+    with agent_cache.checkout(agent_key, build_agents) as (agents, assistant, user_proxy):
+        completed = asyncio.run(single_round_discussion(
+            st.session_state.round_num, agents, user_proxy
+        ))
 
 
     if not st.session_state[f"round_{round_num}_input_completed"]:
@@ -400,9 +414,10 @@ if st.session_state.discussion_started and st.session_state.round_num <= rounds:
             # with st.chat_message("user"):
             #     st.markdown(f"**選擇的技術：** {selected_technique}")
 
-        completed = asyncio.run(single_round_discussion(
-            st.session_state.round_num, agents, user_proxy
-        ))
+        with agent_cache.checkout(agent_key, build_agents) as (agents, assistant, user_proxy):
+            completed = asyncio.run(single_round_discussion(
+                st.session_state.round_num, agents, user_proxy
+            ))
 
     if completed:
         # 如果該輪完成，進入下一輪
@@ -0,0 +1,478 @@
+# 對話紀錄寫入 Supabase
+# 原本每輪結束時在 UI thread 直接送 GET + PATCH/POST，使用者要等兩次網路來回才看得到下一輪。
+# 現在 UI 只把這輪的快照放進 write-behind 佇列，由背景 thread 寫入：
+# - 同一個 session_id 還沒寫出去又來了新快照，只留最新的一份（快照本身就是完整狀態）
+# - 寫入失敗依指數退避重試，不會擋住其他 session 的寫入
+# - process 結束前把佇列裡剩下的快照全部寫出去
+# 預設還會先把快照寫進本地日誌（journal.py），Supabase 很慢或連不上時也只需要等本地磁碟。
+#
+# 兩種儲存方式（secrets 的 [persistence] mode）：
+# - "snapshot"（預設）：每輪把完整的 messages 寫進 conversations 那一列
+# - "append"：conversations 只存中繼資料，訊息逐則寫進 conversation_messages，每輪只送新增的部分；
+#   定期用 `python persistence.py compact` 把訊息併回 conversations.messages
+import argparse
+import atexit
+import copy
+import logging
+import os
+import statistics
+import threading
+import time
+import tomllib
+import uuid
+from collections import deque
+
+import requests
+import requests.adapters
+
+from journal import DEFAULT_JOURNAL_PATH, SnapshotJournal
+
+
+logger = logging.getLogger(__name__)
+
+# (連線, 讀取) 的 timeout；Supabase 很慢或連不上時，背景寫入也不會卡住
+CONNECT_TIMEOUT_SECONDS = 3.05
+READ_TIMEOUT_SECONDS = 10
+# 只有背景寫入 thread 和第一次載入時的讀取會用到，幾條 keep-alive 連線就夠
+POOL_MAXSIZE = 4
+RETRY_BASE_SECONDS = 1.0
+RETRY_MAX_SECONDS = 60.0
+MAX_ATTEMPTS = 8
+SHUTDOWN_FLUSH_SECONDS = 15.0
+# 未壓縮的訊息累積到幾則才值得壓縮
+COMPACT_MIN_ROWS = 200
+
+MAX_LATENCY_SAMPLES = 500
+# 還原只用到這幾個欄位
+RESTORE_COLUMNS = "round,selected_ideas,messages"
+
+
+class PersistError(Exception):
+    pass
+
+
+class PersistMetrics:
+    # 依操作（write / read / ...）記錄每次請求的延遲與失敗次數
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latencies = {}  # {operation: deque[秒]}
+        self._errors = {}
+
+    def record(self, operation, seconds, ok):
+        with self._lock:
+            self._latencies.setdefault(operation, deque(maxlen=MAX_LATENCY_SAMPLES)).append(seconds)
+            if not ok:
+                self._errors[operation] = self._errors.get(operation, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            summary = {}
+            for operation, samples in self._latencies.items():
+                ordered = sorted(samples)
+                summary[operation] = {
+                    "count": len(ordered),
+                    "errors": self._errors.get(operation, 0),
+                    "avg_ms": statistics.fmean(ordered) * 1000,
+                    "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+                    "max_ms": ordered[-1] * 1000,
+                }
+            return summary
+
+
+def pooled_session(pool_maxsize=POOL_MAXSIZE):
+    # 原本每次都是單獨的 requests.get / patch / post，每個請求都重新建立 TLS 連線
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class SupabaseConversationStore:
+    def __init__(self, url, service_key, session=None, timeout=(CONNECT_TIMEOUT_SECONDS, READ_TIMEOUT_SECONDS)):
+        self.endpoint = f"{url}/rest/v1/conversations"
+        self.session = session or pooled_session()
+        self.timeout = timeout
+        self.metrics = PersistMetrics()
+        self.headers = {
+            "apikey": service_key,
+            "Authorization": f"Bearer {service_key}",
+            "Content-Type": "application/json",
+        }
+
+    def _request(self, operation, method, url, ok_statuses, prefer=None, **kwargs):
+        headers = self.headers if prefer is None else dict(self.headers, Prefer=prefer)
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, headers=headers, timeout=self.timeout, **kwargs)
+        except requests.RequestException as e:
+            self.metrics.record(operation, time.perf_counter() - start, ok=False)
+            raise PersistError(f"{method} 連線失敗: {e}") from e
+        ok = response.status_code in ok_statuses
+        self.metrics.record(operation, time.perf_counter() - start, ok)
+        if not ok:
+            raise PersistError(f"{method} 失敗: {response.status_code} - {response.text}")
+        return response
+
+    def _get_json(self, operation, url):
+        return self._request(operation, "GET", url, [200]).json()
+
+    def _upsert_session(self, operation, record):
+        # 一次請求：session_id 已存在就更新，沒有就新增（conversations.session_id 需要 unique）
+        self._request(operation, "POST", f"{self.endpoint}?on_conflict=session_id", [200, 201, 204], json=record,
+                      prefer="resolution=merge-duplicates,return=minimal")
+
+    def write(self, record):
+        # 失敗時丟 PersistError 讓佇列重試
+        self._upsert_session("write", record)
+
+    def load(self, session_id):
+        # 回傳最新一輪的紀錄（沒有就回傳 None）；只要最新一列、只要還原用得到的欄位
+        rows = self._get_json("load", f"{self.endpoint}?session_id=eq.{session_id}&select={RESTORE_COLUMNS}&order=round.desc&limit=1")
+        return rows[0] if rows else None
+
+
+class AppendOnlyConversationStore(SupabaseConversationStore):
+    # conversations.messages 只放已壓縮的前段，message_count 是已寫入的訊息總數；
+    # 之後的訊息在 conversation_messages，(session_id, seq) 為主鍵，seq 就是訊息在整段對話裡的位置
+    def __init__(self, url, service_key, session=None, timeout=(CONNECT_TIMEOUT_SECONDS, READ_TIMEOUT_SECONDS)):
+        super().__init__(url, service_key, session, timeout)
+        self.messages_endpoint = f"{url}/rest/v1/conversation_messages"
+        # 這個 process 已確認寫入的訊息數；只有背景寫入 thread 會改
+        self._persisted = {}
+
+    def _session_row(self, operation, session_id, columns):
+        rows = self._get_json(operation, f"{self.endpoint}?session_id=eq.{session_id}&select={columns}&order=round.desc&limit=1")
+        return rows[0] if rows else None
+
+    def _message_rows(self, operation, session_id, from_seq):
+        return self._get_json(operation, f"{self.messages_endpoint}?session_id=eq.{session_id}&seq=gte.{from_seq}&select=seq,role,content&order=seq.asc")
+
+    def write(self, record):
+        session_id = record["session_id"]
+        messages = record["messages"]
+        persisted = self._persisted.get(session_id)
+        if persisted is None:
+            # 這個 process 第一次寫這個 session（例如重新啟動後還原的討論），問一次已經寫到哪裡
+            row = self._session_row("write", session_id, "message_count")
+            persisted = (row or {}).get("message_count") or 0
+
+        # 只送上次成功寫入之後新增的訊息；重試時重複的 seq 直接忽略
+        new_rows = [
+            {"session_id": session_id, "seq": seq, "role": message["role"], "content": message["content"]}
+            for seq, message in enumerate(messages[persisted:], start=persisted)
+        ]
+        if new_rows:
+            self._request("write", "POST", f"{self.messages_endpoint}?on_conflict=session_id,seq", [200, 201, 204], json=new_rows,
+                          prefer="resolution=ignore-duplicates,return=minimal")
+
+        # 中繼資料不帶 messages（那是壓縮過的前段），新的一列用欄位預設值
+        metadata = {key: value for key, value in record.items() if key != "messages"}
+        metadata["message_count"] = max(persisted, len(messages))
+        self._upsert_session("write", metadata)
+        self._persisted[session_id] = metadata["message_count"]
+
+    def load(self, session_id):
+        # 已壓縮的前段 + 之後逐則寫入的訊息，組回跟 snapshot 模式一樣的紀錄
+        row = self._session_row("load", session_id, RESTORE_COLUMNS)
+        if row is None:
+            return None
+        prefix = row.get("messages") or []
+        tail = self._message_rows("load", session_id, len(prefix))
+        row["messages"] = prefix + [{"role": r["role"], "content": r["content"]} for r in tail]
+        return row
+
+    def compact(self, session_id):
+        # 把 conversation_messages 併回 conversations.messages 再刪掉已併入的列；回傳併入幾則
+        # 先更新 conversations 再刪除，中途讀取也只會看到「前段 + seq >= 前段長度」的完整對話
+        row = self._session_row("compact", session_id, "id,messages")
+        if row is None:
+            return 0
+        prefix = row.get("messages") or []
+        tail = self._message_rows("compact", session_id, len(prefix))
+        if not tail:
+            return 0
+        if tail[0]["seq"] != len(prefix) or tail[-1]["seq"] != len(prefix) + len(tail) - 1:
+            raise PersistError(f"session {session_id} 的訊息序號不連續，略過壓縮")
+
+        merged = prefix + [{"role": r["role"], "content": r["content"]} for r in tail]
+        self._request("compact", "PATCH", f"{self.endpoint}?id=eq.{row['id']}", [200, 204], json={"messages": merged, "compacted_count": len(merged)},
+                      prefer="return=minimal")
+        self._request("compact", "DELETE", f"{self.messages_endpoint}?session_id=eq.{session_id}&seq=lt.{len(merged)}", [200, 204])
+        return len(tail)
+
+    def compact_all(self, min_rows=COMPACT_MIN_ROWS):
+        rows = self._request("compact", "GET", f"{self.endpoint}?select=session_id,message_count,compacted_count", [200]).json()
+        compacted = {}
+        for row in rows:
+            if (row.get("message_count") or 0) - (row.get("compacted_count") or 0) >= min_rows:
+                compacted[row["session_id"]] = self.compact(row["session_id"])
+        return compacted
+
+
+STORES = {
+    "snapshot": SupabaseConversationStore,
+    "append": AppendOnlyConversationStore,
+}
+
+
+class WriteBehindQueue:
+    def __init__(self, store, retry_base=RETRY_BASE_SECONDS, retry_max=RETRY_MAX_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.store = store
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.max_attempts = max_attempts
+        self._pending = {}  # {session_id: {"record": dict, "attempts": int, "due": float}}
+        self._in_flight = {}  # {session_id: entry}
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._stats = {"enqueued": 0, "coalesced": 0, "written": 0, "retries": 0, "dropped": 0}
+        self._last_error = {}  # {session_id: str}
+        self._worker = threading.Thread(target=self._run, name="persistence-write-behind", daemon=True)
+        self._worker.start()
+
+    def enqueue(self, session_id, record):
+        # 在 UI thread 呼叫：複製一份快照（session_state 裡的 list 之後還會被改）就回傳
+        self._put(session_id, copy.deepcopy(record))
+
+    def _put(self, session_id, snapshot, **position):
+        with self._condition:
+            if session_id in self._pending:
+                self._stats["coalesced"] += 1
+            self._pending[session_id] = {"record": snapshot, "attempts": 0, "due": time.monotonic(), **position}
+            self._stats["enqueued"] += 1
+            self._condition.notify()
+
+    def _next_ready(self):
+        # 呼叫端已持有鎖；回傳 (session_id, entry) 或下一筆可以寫的剩餘秒數
+        now = time.monotonic()
+        earliest = None
+        for session_id, entry in self._pending.items():
+            if session_id in self._in_flight:
+                continue
+            if self._stopping or entry["due"] <= now:
+                return session_id, entry
+            earliest = entry["due"] if earliest is None else min(earliest, entry["due"])
+        return None, (None if earliest is None else earliest - now)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    session_id, entry = self._next_ready()
+                    if session_id is not None:
+                        break
+                    if self._stopping and not self._pending:
+                        return
+                    self._condition.wait(timeout=entry)
+                self._in_flight[session_id] = self._pending.pop(session_id)
+
+            try:
+                self.store.write(entry["record"])
+                error = None
+            except Exception as e:
+                error = str(e)
+
+            with self._condition:
+                del self._in_flight[session_id]
+                if error is None:
+                    self._stats["written"] += 1
+                    self._last_error.pop(session_id, None)
+                    self._on_written(session_id, entry)
+                else:
+                    self._last_error[session_id] = error
+                    self._retry(session_id, entry, error)
+                self._condition.notify_all()
+
+    def _retry(self, session_id, entry, error):
+        # 呼叫端已持有鎖；寫入期間已經有新的快照就直接用新的，不再重試舊的
+        if session_id in self._pending:
+            return
+        entry["attempts"] += 1
+        gave_up = self.max_attempts is not None and entry["attempts"] >= self.max_attempts
+        if gave_up or (self._stopping and entry["attempts"] >= 2):
+            self._stats["dropped"] += 1
+            logger.error("放棄寫入 session %s（已試 %d 次）：%s", session_id, entry["attempts"], error)
+            self._on_dropped(session_id, entry)
+            return
+        delay = min(self.retry_max, self.retry_base * 2 ** (entry["attempts"] - 1))
+        entry["due"] = time.monotonic() + delay
+        self._pending[session_id] = entry
+        self._stats["retries"] += 1
+        logger.warning("寫入 session %s 失敗，%.1f 秒後重試：%s", session_id, delay, error)
+
+    def pending_snapshot(self, session_id):
+        # 還沒同步出去的最新快照（比遠端新）；沒有就回傳 None
+        with self._condition:
+            entry = self._pending.get(session_id) or self._in_flight.get(session_id)
+            return copy.deepcopy(entry["record"]) if entry else None
+
+    def _on_written(self, session_id, entry):
+        # 呼叫端已持有鎖；給子類別記錄同步進度
+        pass
+
+    def _on_dropped(self, session_id, entry):
+        pass
+
+    def flush(self, timeout=None):
+        # 等到佇列清空（或逾時）；回傳是否全部寫完
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            self._condition.notify_all()
+            while self._pending or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(timeout=remaining)
+            return True
+
+    def shutdown(self, timeout=SHUTDOWN_FLUSH_SECONDS):
+        # 結束前不再等退避時間，剩下的快照直接寫出去
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        flushed = self.flush(timeout)
+        self._worker.join(timeout=1)
+        if not flushed:
+            logger.error("結束時仍有 %d 個 session 沒有寫入", len(self._pending))
+        return flushed
+
+    def last_error(self, session_id):
+        with self._condition:
+            return self._last_error.get(session_id)
+
+    def stats(self):
+        with self._condition:
+            return dict(self._stats, pending=len(self._pending), in_flight=len(self._in_flight))
+
+
+class JournaledWriteQueue(WriteBehindQueue):
+    # 快照先寫進本地日誌（fsync 後才回傳），再交給背景 thread 同步到 Supabase：
+    # - 同步失敗不放棄，一直依退避時間重試（資料已經在本地日誌裡）
+    # - checkpoint 記錄日誌裡哪個位置之前都已同步，重新啟動時從那裡補送
+    def __init__(self, store, journal_path=DEFAULT_JOURNAL_PATH, **kwargs):
+        self.journal = SnapshotJournal(journal_path)
+        self.checkpoint_path = journal_path + ".checkpoint"
+        self._checkpoint = self._load_checkpoint()
+        self._enqueued_end = self._checkpoint
+        self._dropped_floor = None
+        super().__init__(store, max_attempts=None, **kwargs)
+
+        replayed = self.journal.read(self._checkpoint)
+        for offset, end, record in replayed:
+            self._put(record["session_id"], record, offset=offset, end=end)
+        if replayed:
+            logger.warning("從本地日誌補送 %d 筆還沒同步的快照", len(replayed))
+
+    def _load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, encoding="utf-8") as f:
+                checkpoint = int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+        # 日誌被手動清掉或比 checkpoint 短時，從頭補送（upsert 重送也沒關係）
+        return checkpoint if checkpoint <= self.journal.stats()["bytes"] else 0
+
+    def enqueue(self, session_id, record):
+        snapshot = copy.deepcopy(record)
+        offset, end = self.journal.append(snapshot)
+        self._put(session_id, snapshot, offset=offset, end=end)
+
+    def _put(self, session_id, snapshot, **position):
+        with self._condition:
+            self._enqueued_end = max(self._enqueued_end, position["end"])
+            super()._put(session_id, snapshot, **position)
+
+    def _on_written(self, session_id, entry):
+        # 還沒同步的快照（等待中、寫入中、放棄的）之中最早的起點，就是可以放心跳過的位置
+        unsynced = [e["offset"] for e in self._pending.values()] + [e["offset"] for e in self._in_flight.values()]
+        if self._dropped_floor is not None:
+            unsynced.append(self._dropped_floor)
+        checkpoint = min(unsynced, default=self._enqueued_end)
+        if checkpoint <= self._checkpoint:
+            return
+
+        if self.journal.truncate_if_synced(checkpoint):
+            checkpoint = self._enqueued_end = 0
+        self._checkpoint = checkpoint
+        # checkpoint 掉了只是多重送幾筆，不需要 fsync
+        temporary = self.checkpoint_path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.write(str(checkpoint))
+        os.replace(temporary, self.checkpoint_path)
+
+    def _on_dropped(self, session_id, entry):
+        # 結束前來不及同步的快照留在日誌裡，下次啟動再補送
+        self._dropped_floor = entry["offset"] if self._dropped_floor is None else min(self._dropped_floor, entry["offset"])
+
+    def stats(self):
+        with self._condition:
+            journal_stats = self.journal.stats()
+            return dict(super().stats(), journal_bytes=journal_stats["bytes"], fsyncs=journal_stats["fsyncs"],
+                        unsynced_bytes=journal_stats["bytes"] - self._checkpoint)
+
+
+_write_queue = None
+_write_queue_lock = threading.Lock()
+
+
+def get_write_queue(url, service_key, mode="snapshot", journal_path=DEFAULT_JOURNAL_PATH):
+    # 整個 process 只有一個佇列；設定只在第一次建立時生效，journal_path 為 None 時不寫本地日誌
+    global _write_queue
+    with _write_queue_lock:
+        if _write_queue is None:
+            store = STORES[mode](url, service_key)
+            _write_queue = WriteBehindQueue(store) if journal_path is None else JournaledWriteQueue(store, journal_path)
+            atexit.register(_write_queue.shutdown)
+        return _write_queue
+
+
+def bench(store, rounds):
+    # 模擬一個 session 連續寫入 rounds 輪（每輪三則約 2 KB 的訊息），回傳各操作的延遲
+    session_id = f"bench-{uuid.uuid4()}"
+    messages = []
+    for round_num in range(rounds):
+        messages += [
+            {"role": "Agent A", "content": "商業" * 400},
+            {"role": "Agent B", "content": "工程" * 400},
+            {"role": "Assistant", "content": "✅ Idea 1: 點子" * 40},
+        ]
+        store.write({"session_id": session_id, "round": round_num, "user_question": "bench", "messages": messages, "selected_ideas": []})
+    if store.load(session_id)["messages"] != messages:
+        raise PersistError("讀回的對話跟寫入的不一致")
+    return store.metrics.snapshot()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="對話紀錄儲存的維護工具")
+    parser.add_argument("command", choices=["compact", "bench"],
+                        help="compact：把 conversation_messages 併回 conversations.messages；bench：對本地測試伺服器量測寫入延遲")
+    parser.add_argument("--url", default=None, help="Supabase（或本地測試伺服器）網址，預設讀 .streamlit/secrets.toml；bench 必須指定")
+    parser.add_argument("--mode", choices=sorted(STORES), default="append")
+    parser.add_argument("--session", default=None, help="只壓縮這個 session（預設是所有累積夠多訊息的 session）")
+    parser.add_argument("--min-rows", type=int, default=COMPACT_MIN_ROWS)
+    parser.add_argument("--rounds", type=int, default=30)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        if args.url is None:
+            parser.error("bench 會寫入測試資料，請用 --url 指定本地測試伺服器")
+        for operation, m in bench(STORES[args.mode](args.url, "bench"), args.rounds).items():
+            print(f"{operation}: {m['count']} 次，平均 {m['avg_ms']:.1f} ms，p95 {m['p95_ms']:.1f} ms，最長 {m['max_ms']:.1f} ms，失敗 {m['errors']} 次")
+        return
+
+    with open(".streamlit/secrets.toml", "rb") as f:
+        secrets = tomllib.load(f)["supabase"]
+    store = AppendOnlyConversationStore(args.url or secrets["url"], secrets["service_key"])
+
+    if args.session:
+        compacted = {args.session: store.compact(args.session)}
+    else:
+        compacted = store.compact_all(args.min_rows)
+    for session_id, count in compacted.items():
+        print(f"{session_id}: 併入 {count} 則訊息")
+    print(f"共壓縮 {len(compacted)} 個 session")
+
+
+if __name__ == "__main__":
+    main()
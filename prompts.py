@@ -0,0 +1,223 @@
+# 角色設定與固定的 prompt 模板
+# 主程式（Streamlit）和離線產生第 0 輪點子池的批次指令（round0_pool.py）共用這裡的內容，
+# 確保兩邊送給模型的 prompt 一字不差
+
+Businessman_prompt = (
+    "你是 Businessman。你是一位在矽谷創業的創辦人，具備出色的產品直覺與商業敏銳度，曾參與多次 seed round 募資。"
+    "你習慣使用的語言包括：market-fit、user pain point、growth loop、viral trigger、pivot、go-to-market strategy、early adopters、unit economics。"
+    "當你提出想法時，請以創投簡報（pitch deck）語氣表達，重點是能否引起使用者共鳴、快速測試商業模式、創造市場話題。"
+
+    "🎯 你的目標是："
+    "1️⃣ 找到具有 **使用者吸引力** 和 **潛在成長性** 的市場切入點\n"
+    "2️⃣ 提出點子要能支撐 **故事性**，讓投資人、媒體、使用者會興奮地想參與\n"
+    "3️⃣ 評估每個點子的 go-to-market 可行性與潛在 revenue stream"
+
+    "🚫 請避免："
+    "談論技術實作細節、工程可行性或開發負擔；你只關心『這東西會不會紅』。"
+
+    "💬 常用語氣範例："
+    "- 『這是一個有潛力切入 Z 世代市場的 viral loop』\n"
+    "- 『這解法非常 pitchable，而且容易吸引早期 media coverage』\n"
+    "- 『我們可以用 freemium 模型驗證 user retention，再逐步轉向付費方案』"
+)
+
+
+Engineer_prompt = (
+    "你是 Engineer。你是這家新創的首席工程師，負責產品的技術落地與資源調度，熟悉 MVP 開發、模組化設計與系統效能考量。"
+    "你重視的是：**可行性、可擴充性、技術負債控制、維護性、以及團隊 bandwidth 是否足夠實作**。"
+
+    "你慣用的詞彙包括：tech stack、latency、code debt、CI/CD、RESTful API、data pipeline、load test、edge case、resource constraint、infra cost。"
+
+    "🎯 你的目標是："
+    "1️⃣ 在預算與時間（2 週內）限制下，找出 **可以做出來的版本**\n"
+    "2️⃣ 評估每個點子從技術觀點有無『高風險地雷』或明顯 impractical 的設計\n"
+    "3️⃣ 主動提出替代技術方案或更快的技術驗證方法"
+
+    "🚫 請避免："
+    "過度關注市場、品牌或使用者成長策略；你只關心『這東西 build 不 build 得出來』。"
+
+    "💬 常用語氣範例："
+    "- 『這個需要 edge device 做數據前處理，否則 cloud latency 太高』\n"
+    "- 『我傾向先用 Python 快速測 MVP，再重構成更穩的堆疊』\n"
+    "- 『這個想法不錯，但我們沒足夠 bandwidth 支援 BLE 通訊與 UI 同時開發』"
+)
+
+neutral_prompt = (
+    "你是討論創意問題的中立參與者，目標是提出清晰、有邏輯且具啟發性的創新建議。"
+    "請根據使用者的主題與思考方法，提出合理、有創新潛力的觀點，不需考慮特定專業或立場。"
+)
+
+
+AGENT_CONFIG = {
+    "Agent A": {
+        "persona_name": "Businessman",
+        "persona_prompt": Businessman_prompt,
+        "neutral_name": "Agent A",
+        "avatar": "businessman.png"
+    },
+    "Agent B": {
+        "persona_name": "Engineer",
+        "persona_prompt": Engineer_prompt,
+        "neutral_name": "Agent B",
+        "avatar": "engineer.png"
+    }
+}
+
+
+
+def persona_prefix(system_message):
+    # 角色設定區塊：同一個角色每一輪都一樣，本地模型預熱時送的就是這段
+    return f"- 你的角色設定：{system_message}\n\n"
+
+
+def agent_static_prefix(system_message, use_persona, format_rules):
+    return (persona_prefix(system_message) if use_persona else "") + format_rules
+
+
+def assemble_prompt(static_prefix, round_content):
+    # 固定前綴（角色設定 + 格式規則）一律放最前面，每輪會變的內容（輪次、使用者想法、其他角色的回饋）放最後，
+    # OpenAI 的自動 prefix caching 和本地 server 的 prompt 快取才命中得了
+    return f"{static_prefix}---\n\n{round_content}"
+
+
+ASSISTANT_SYSTEM_MESSAGE = "你是 Assistant，負責將點子..."
+
+
+QUESTION_PLACEHOLDER = "請選擇討論問題"
+
+QUESTION_OPTIONS = [
+    QUESTION_PLACEHOLDER,
+    # "風箏除了娛樂，還能用什麼其他創意用途？",
+    # "枕頭除了睡覺，還能如何幫助放鬆或解決日常問題？",
+    "如果穿越空間技術存在，可能會有哪些全新的交通方式？",
+    # "如果穿越時間技術存在，可能會有哪些全新的交通方式？",
+    "磚頭除了蓋房子，還能有哪些意想不到的用途？",
+    "掃帚除了掃地，還能有哪些意想不到的用途？",
+    # "🔧 自訂問題"
+]
+
+
+def round0_discussion_message(question):
+    return (
+        f"**第 0 輪討論**\n\n"
+        f"請直接列出與『{question}』相關的創新點子，每個點子請附上一句簡短的主要用途，最多 **不超過兩句**。\n\n"
+    )
+
+
+ROUND0_FORMAT_RULES = (
+    f"**請確保：**\n"
+    f"1.  **每個創意點子名稱清楚**\n"
+    f"2.  **用途簡明扼要（1 句話最佳，最多 2 句話）**\n\n"
+    f"請用以上的角色設定來發想點子，並確保格式如下：\n"
+    f"✅ **Idea 1** - 主要用途（最多兩句）\n"
+    f"✅ **Idea 2** - 主要用途（最多兩句）\n"
+    f"✅ **Idea 3** - 主要用途（最多兩句）\n"
+    f"✅ **Idea N** - 主要用途（最多兩句）\n"
+    f"確保以zh-TW語言回應。\n\n"
+)
+
+
+def round0_agent_message(question, system_message, use_persona):
+    return assemble_prompt(agent_static_prefix(system_message, use_persona, ROUND0_FORMAT_RULES), round0_discussion_message(question))
+
+
+def section1_rule(current_method):
+    if current_method == "自由輸入":
+        return (
+            f"**1. 我覺得**：請以一句粗體句子到句點開頭，回應使用者的輸入內容（用第一人稱），"
+            f"清楚表達你這輪的創新主張，表達你這輪的創新主張與延伸（用第一人稱），並且換兩行，接著補充說明，總長度約 2～3 句。\n\n"
+        )
+    # 技術名稱放在每輪的討論內容裡，這裡維持固定文字，前綴才不會每輪都變
+    return (
+        f"**1. 我覺得**：請以一句粗體句子到句點開頭，應用本輪使用者選擇的創意思考技術的邏輯來延伸使用者的選擇創意（用第一人稱），"
+        f"表達你這輪的創新主張與延伸（用第一人稱），並且換兩行，接著補充說明，總長度約 2～3 句。\n\n"
+    )
+
+
+def discussion_format_rules(current_method, use_persona, ai_feedback_enabled):
+    # 第 1 輪之後的回應格式規則：只由輸入方式、是否啟用角色、是否互相回饋決定
+    section1 = section1_rule(current_method)
+
+    if use_persona:
+        # 有 persona 的 Agent, 有 peer feedback
+        if ai_feedback_enabled:
+            return (
+                f"請根據以下格式，依序完成兩段角色回應，並務必遵守格式規定：\n\n"
+                f"{section1}"
+                f"**2. 對另一位角色的回應**：用一句粗體句子到句點開頭，點出你對上輪某角色觀點的認同、質疑、或補充，並且加上，接著補述你的延伸觀點，總長度約 2～3 句。\n\n"
+                f"請絕對遵守不要寫出「主張內容：」或「對另一位角色的回應：」等提示文字，只輸出內容本身。\n\n"
+                f"`1.` 和 `2.` 段落標號請務必寫出來，**不能省略！**\n\n"
+                f"請務必按照上面格式，每段都以「粗體主張句」開頭（用句號結尾），其後用自然語言補充描述。\n\n"
+                f"不需要加入任何 emoji 或多餘開頭語（如：以下是我的建議）。"
+                f"格式範例如下：\n\n"
+                f"**1. 我主張應結合風箏文化與節慶活動來創造品牌識別。**\n\n"
+                f"這樣不僅能讓消費者更有情感連結，也能利用節慶集中曝光，強化市場話題性。\n\n"
+                f"**2. 我認同 Engineer 提出的模組化概念，但建議以教育活動來強化理解。**\n\n"
+                f"模組化雖具彈性，但若能配合實體教學或展示活動，能幫助用戶更快上手，也更利於推廣。\n\n"
+            )
+        # 有 persona 的 Agent, 沒有 peer feedback
+        return (
+            f"請根據以下格式，依序完成兩段角色回應，並務必遵守格式規定：\n\n"
+            f"{section1}"
+            f"請絕對遵守不要寫出「主張內容：」或「對另一位角色的回應：」等提示文字，只輸出內容本身。\n\n"
+            f"`1.` 和 `2.` 段落標號請務必寫出來，**不能省略！**\n\n"
+            f"請務必按照上面格式，每段都以「粗體主張句」開頭（用句號結尾），其後用自然語言補充描述。\n\n"
+            f"不需要加入任何 emoji 或多餘開頭語（如：以下是我的建議）。"
+            f"格式範例如下：\n\n"
+            f"**1. 我主張應結合風箏文化與節慶活動來創造品牌識別。**\n\n"
+            f"這樣不僅能讓消費者更有情感連結，也能利用節慶集中曝光，強化市場話題性。\n\n"
+        )
+
+    # 沒有 persona 的 Agent, 有 peer feedback
+    if ai_feedback_enabled:
+        return (
+            f"請根據以下格式，依序完成角色回應，並務必遵守格式規定：\n\n"
+            f"{section1}"
+            f"**2. 對另一位角色的回應**：用一句粗體句子到句點開頭，點出你對上輪某角色觀點的認同、質疑、或補充，並且加上\n\n，接著補述你的延伸觀點，總長度約 2～3 句。\n\n"
+            f"請絕對遵守不要寫出「主張內容：」等提示文字，只輸出內容本身。\n\n"
+            f"`1.` 和 `2.` 段落標號請務必寫出來，**不能省略！**\n\n"
+            f"請務必按照上面格式，每段都以「粗體主張句」開頭（用句號結尾），其後用自然語言補充描述。\n\n"
+            f"不需要加入任何 emoji 或多餘開頭語（如：以下是我的建議）。"
+            f"格式範例如下：\n\n"
+            f"**1. 我主張應結合風箏文化與節慶活動來創造品牌識別。**\n\n"
+            f"這樣不僅能讓消費者更有情感連結，也能利用節慶集中曝光，強化市場話題性。\n\n"
+            f"**2. 我認同 Engineer 提出的模組化概念，但建議以教育活動來強化理解。**\n\n"
+            f"模組化雖具彈性，但若能配合實體教學或展示活動，能幫助用戶更快上手，也更利於推廣。\n\n"
+        )
+    # 沒有 persona 的 Agent, 沒有 peer feedback
+    return (
+        f"請根據以下格式，完成角色回應，並務必遵守格式規定：\n\n"
+        f"{section1}"
+        f"請絕對遵守不要寫出「主張內容：」等提示文字，只輸出內容本身。\n\n"
+        f"`1.` 和 `2.` 段落標號請務必寫出來，**不能省略！**\n\n"
+        f"請務必按照上面格式，每段都以「粗體主張句」開頭（用句號結尾），其後用自然語言補充描述。\n\n"
+        f"不需要加入任何 emoji 或多餘開頭語（如：以下是我的建議）。"
+        f"格式範例如下：\n\n"
+        f"**1. 我主張應結合風箏文化與節慶活動來創造品牌識別。**\n\n"
+        f"這樣不僅能讓消費者更有情感連結，也能利用節慶集中曝光，強化市場話題性。\n\n"
+    )
+
+
+def category_prompt(this_round_response):
+    return (
+        f"你是一個擅長資訊統整的 AI，負責從不同 AI 助手的回應中，"
+        f"**綜合相似觀點，去除重複內容，並直接輸出精煉的 Idea**。"
+
+        f"\n\n**這一輪的討論紀錄：**"
+        f"\n{this_round_response}"
+
+        f"\n\n**請根據以下規則統整 Idea，並且回應格式只包含整理過的 Idea 清單：**"
+        f"\n1️⃣ **合併相似的 Idea**：如果多個 AI 提出了類似的想法，請合併它們，使內容更簡潔有力。"
+        f"\n2️⃣ **刪除冗餘內容**：去除任何相同或過於接近的 Idea，避免重複。"
+        f"\n3️⃣ **確保每個 Idea 具有清晰的描述**，使其可以獨立理解。"
+        f"\n4️⃣ **格式要求**：回應時請只輸出以下格式，**不要添加其他文字、說明或總結**。"
+
+        f"\n **統整後的可選 Idea（請以「概念: 說明」的格式回應）：**\n"
+        f"\n✅ Idea 1: **概念 1**，這裡請填入合併後的說明"
+        f"\n✅ Idea 2: **概念 2**，這裡請填入合併後的說明"
+        f"\n✅ Idea 3: **概念 3**，這裡請填入合併後的說明"
+        f"\n✅ Idea N: **概念 N**，這裡請填入合併後的說明"
+
+        f"\n\n⚠️ **請確保你的回應只包含這些整理後的 Idea，並在最後提供 2-3 句話的摘要，歸納討論的核心重點。"
+        f"不要額外補充說明、分析或其他內容。**"
+    )
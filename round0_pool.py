@@ -0,0 +1,157 @@
+# 第 0 輪點子池：離線先替每個「題目 × 角色模式」產生多組第 0 輪回應，
+# 參與者開始討論時直接抽一組顯示，第 0 輪就不用等模型。
+#
+# 產生點子池：
+#   python round0_pool.py --model gpt-4o --per-combo 5
+#   python round0_pool.py --model llama3-taiwan --base-url http://127.0.0.1:1234/v1 --per-combo 5
+import argparse
+import asyncio
+import datetime
+import gzip
+import json
+import os
+import random
+import threading
+import tomllib
+
+os.environ["AUTOGEN_USE_DOCKER"] = "0"
+
+from prompts import AGENT_CONFIG, ASSISTANT_SYSTEM_MESSAGE, QUESTION_OPTIONS, QUESTION_PLACEHOLDER, neutral_prompt
+from prompts import category_prompt, round0_agent_message
+
+
+DEFAULT_POOL_PATH = "round0_pool.json.gz"
+
+# 角色模式：persona = 啟用角色設定，neutral = 使用 neutral_prompt
+MODES = {"persona": True, "neutral": False}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def mode_name(use_persona):
+    return "persona" if use_persona else "neutral"
+
+
+def load_round0_pool(path=DEFAULT_POOL_PATH):
+    # 每個 process 只讀一次檔案；檔案不存在就當作沒有點子池
+    with _pools_lock:
+        if path not in _pools:
+            try:
+                with gzip.open(path, "rt", encoding="utf-8") as f:
+                    _pools[path] = json.load(f)
+            except FileNotFoundError:
+                _pools[path] = {}
+        return _pools[path]
+
+
+def sample_round0_entry(question, use_persona, model, path=DEFAULT_POOL_PATH):
+    # 點子池是用特定模型產生的，只有同一個模型的 session 才拿來用
+    pool = load_round0_pool(path)
+    if not pool or pool.get("model") != model:
+        return None
+
+    entries = pool.get("entries", {}).get(question, {}).get(mode_name(use_persona), [])
+    if not entries:
+        return None
+    return dict(random.choice(entries))
+
+
+async def generate_entry(question, use_persona, llm_config):
+    from autogen import ConversableAgent, UserProxyAgent
+
+    # 跟主程式一樣的 agent 組合與 prompt，產生一組 Agent A / Agent B / Assistant 的第 0 輪回應
+    user_proxy = UserProxyAgent(name="User", llm_config=llm_config, human_input_mode="NEVER", code_execution_config=False)
+
+    async def ask(agent, message):
+        response = await agent.a_initiate_chat(user_proxy, message=message, max_turns=1, clear_history=True, silent=True)
+        return response.chat_history[-1]["content"].strip()
+
+    persona_tasks = {}
+    for tag, config in AGENT_CONFIG.items():
+        system_message = config["persona_prompt"] if use_persona else neutral_prompt
+        agent = ConversableAgent(name=tag.replace(" ", "_"), llm_config=llm_config, system_message=system_message)
+        persona_tasks[tag] = ask(agent, round0_agent_message(question, system_message, use_persona))
+
+    responses = dict(zip(persona_tasks.keys(), await asyncio.gather(*persona_tasks.values())))
+
+    assistant = ConversableAgent(name="Assistant", llm_config=llm_config, system_message=ASSISTANT_SYSTEM_MESSAGE)
+    responses["Assistant"] = await ask(assistant, category_prompt(dict(responses)))
+    return responses
+
+
+async def build_pool(llm_config, per_combo, concurrency, existing=None):
+    entries = existing or {}
+    semaphore = asyncio.Semaphore(concurrency)
+    questions = [q for q in QUESTION_OPTIONS if q != QUESTION_PLACEHOLDER]
+
+    async def generate(question, mode):
+        async with semaphore:
+            entry = await generate_entry(question, MODES[mode], llm_config)
+        entries.setdefault(question, {}).setdefault(mode, []).append(entry)
+        print(f"✅ {mode} | {question}（目前 {len(entries[question][mode])} 組）")
+
+    await asyncio.gather(*[
+        generate(question, mode)
+        for question in questions
+        for mode in MODES
+        for _ in range(per_combo)
+    ])
+    return entries
+
+
+def read_api_key():
+    if os.getenv("OPENAI_API_KEY"):
+        return os.getenv("OPENAI_API_KEY")
+    try:
+        with open(".streamlit/secrets.toml", "rb") as f:
+            return tomllib.load(f)["api_keys"]["OPENAI_API_KEY"]
+    except (FileNotFoundError, KeyError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="離線產生第 0 輪點子池")
+    parser.add_argument("--model", default="gpt-4o")
+    parser.add_argument("--base-url", default=None, help="本地模型的 API 端點，例如 http://127.0.0.1:1234/v1")
+    parser.add_argument("--temperature", type=float, default=1.0)
+    parser.add_argument("--per-combo", type=int, default=5, help="每個題目 × 角色模式要產生幾組")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--output", default=DEFAULT_POOL_PATH)
+    parser.add_argument("--append", action="store_true", help="保留既有點子池（同一模型）再追加")
+    args = parser.parse_args()
+
+    llm_config = {
+        "config_list": [
+            {
+                "model": args.model,
+                "api_key": read_api_key(),
+                "base_url": args.base_url,
+                "temperature": args.temperature,
+                "stream": False
+            }
+        ],
+        "cache_seed": None
+    }
+
+    existing = None
+    if args.append:
+        pool = load_round0_pool(args.output)
+        if pool.get("model") == args.model:
+            existing = pool.get("entries")
+
+    entries = asyncio.run(build_pool(llm_config, args.per_combo, args.concurrency, existing))
+
+    pool = {
+        "model": args.model,
+        "temperature": args.temperature,
+        "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "entries": entries,
+    }
+    with gzip.open(args.output, "wt", encoding="utf-8") as f:
+        json.dump(pool, f, ensure_ascii=False, separators=(",", ":"))
+    print(f"已寫入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# 以 user_session_id 分區的快取
+# 原本每次執行都 st.cache_data.clear() / st.cache_resource.clear()，等於所有人的快取一起清掉；
+# 現在共用的資源（圖片、client 等）直接用 st.cache_data / st.cache_resource 放在 process 層級，
+# 只屬於某位使用者的資料放在這裡，依 user_session_id 分區，閒置太久的分區自動淘汰，不需要全域清除。
+import threading
+import time
+from collections import OrderedDict
+
+
+SESSION_IDLE_SECONDS = 2 * 60 * 60
+MAX_ENTRIES_PER_SESSION = 64
+EVICTION_INTERVAL_SECONDS = 60
+
+
+class SessionCache:
+    def __init__(self, idle_seconds=SESSION_IDLE_SECONDS, max_entries=MAX_ENTRIES_PER_SESSION):
+        self.idle_seconds = idle_seconds
+        self.max_entries = max_entries
+        self._namespaces = {}  # {user_session_id: {"entries": OrderedDict, "last_access": float}}
+        self._lock = threading.Lock()
+        self._last_eviction = 0.0
+
+    def _namespace(self, session_id, now):
+        namespace = self._namespaces.setdefault(session_id, {"entries": OrderedDict(), "last_access": now})
+        namespace["last_access"] = now
+        return namespace
+
+    def get_or_compute(self, session_id, key, compute):
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            entries = self._namespace(session_id, now)["entries"]
+            if key in entries:
+                entries.move_to_end(key)
+                return entries[key]
+
+        value = compute()
+        with self._lock:
+            entries = self._namespace(session_id, time.monotonic())["entries"]
+            entries[key] = value
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+        return value
+
+    def clear_session(self, session_id):
+        with self._lock:
+            self._namespaces.pop(session_id, None)
+
+    def _evict_idle(self, now):
+        # 呼叫端已持有鎖；每分鐘最多掃一次
+        if now - self._last_eviction < EVICTION_INTERVAL_SECONDS:
+            return
+        self._last_eviction = now
+        idle = [sid for sid, namespace in self._namespaces.items() if now - namespace["last_access"] > self.idle_seconds]
+        for sid in idle:
+            del self._namespaces[sid]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._namespaces),
+                "entries": sum(len(namespace["entries"]) for namespace in self._namespaces.values()),
+            }
+
+
+_session_cache = None
+_session_cache_lock = threading.Lock()
+
+
+def get_session_cache():
+    global _session_cache
+    with _session_cache_lock:
+        if _session_cache is None:
+            _session_cache = SessionCache()
+        return _session_cache
@@ -0,0 +1,30 @@
+from chat_render import group_messages_by_round
+
+
+def session_messages(rounds, in_progress=False):
+    # 跟 single_round_discussion 存進 _messages 的順序一樣：
+    # 第 0 輪先有題目（assistant），每輪兩位角色回應，最後是使用者這輪的輸入
+    messages = [{"role": "assistant", "content": "這是第 0 輪討論，風箏除了娛樂，還能用什麼其他創意用途？"}]
+    for round_num in range(rounds):
+        messages += [
+            {"role": "商業專家", "content": f"第 {round_num} 輪的商業觀點。"},
+            {"role": "工程師", "content": f"第 {round_num} 輪的工程觀點。"},
+            {"role": "user", "content": f"- **使用者輸入：**第 {round_num} 輪的想法\n\n"},
+        ]
+    if in_progress:
+        messages.append({"role": "商業專家", "content": "進行中這一輪的回應。"})
+    return messages
+
+
+def test_n_completed_rounds_give_n_groups():
+    for rounds in (1, 3, 8):
+        groups = group_messages_by_round(session_messages(rounds))
+        assert len(groups) == rounds
+        assert all(group[-1]["role"] == "user" for group in groups)
+        assert groups[0][0]["role"] == "assistant"
+
+
+def test_round_in_progress_is_its_own_group():
+    groups = group_messages_by_round(session_messages(3, in_progress=True))
+    assert len(groups) == 4
+    assert [m["role"] for m in groups[-1]] == ["商業專家"]
@@ -0,0 +1,76 @@
+import markdown2
+
+from chat_render import PAGE_STYLESHEET, fadein_html, sentences_html, user_bubble_html
+from text_processing import smart_sentence_split
+
+
+ROUNDS = 30
+PERSONA_REPLY = "風箏可以用來做空中廣告，在海邊吸引遊客。也可以在救難時標示位置！還能當成教學工具，讓學生理解空氣力學。"
+USER_INPUT = "- **使用者輸入：**第 {round_num} 輪想試試看把風箏結合 LED 燈做夜間表演\n\n"
+
+# 每則訊息在內容本身的 HTML 之外，最多多送幾個 bytes 的標記
+USER_BUBBLE_OVERHEAD = len("<div class='user-bubble-row'><div class='user-bubble'></div></div>")
+SENTENCE_OVERHEAD = len("<div></div>")
+FADE_IN_OVERHEAD = len("<div class='fade-in'></div>")
+
+
+def synthetic_session():
+    # 跟 _messages 一樣：第 0 輪的題目，之後每輪兩位角色回應、最後是使用者的輸入
+    messages = [{"role": "assistant", "content": "這是第 0 輪討論，風箏除了娛樂，還能用什麼其他創意用途？"}]
+    for round_num in range(ROUNDS):
+        messages += [
+            {"role": "商業專家", "content": PERSONA_REPLY},
+            {"role": "工程師", "content": PERSONA_REPLY},
+            {"role": "user", "content": USER_INPUT.format(round_num=round_num)},
+        ]
+    return messages
+
+
+def message_html(message):
+    if message["role"] == "user":
+        return user_bubble_html(message["content"])
+    return sentences_html(message["content"])
+
+
+def markdown_bytes(content):
+    return len(markdown2.markdown(content).strip().encode("utf-8"))
+
+
+def test_per_message_markup_has_no_inline_styles():
+    for message in synthetic_session():
+        html = message_html(message)
+        assert "<style" not in html
+        assert "style=" not in html
+    assert "<style" not in fadein_html(PERSONA_REPLY)
+    assert "animation-delay" not in fadein_html(PERSONA_REPLY)
+
+
+def test_user_bubble_bytes():
+    content = USER_INPUT.format(round_num=3)
+    assert len(user_bubble_html(content).encode("utf-8")) == markdown_bytes(content) + USER_BUBBLE_OVERHEAD
+
+
+def test_sentence_bytes():
+    sentences = smart_sentence_split(PERSONA_REPLY)
+    content_bytes = sum(markdown_bytes(sentence) for sentence in sentences)
+    assert len(sentences_html(PERSONA_REPLY).encode("utf-8")) == content_bytes + SENTENCE_OVERHEAD * len(sentences)
+    assert len(fadein_html(PERSONA_REPLY).encode("utf-8")) == content_bytes + SENTENCE_OVERHEAD * len(sentences) + FADE_IN_OVERHEAD
+
+
+def test_page_stylesheet_bytes():
+    assert len(PAGE_STYLESHEET.encode("utf-8")) <= 2600
+
+
+def test_history_payload_per_rerun():
+    # 每次 rerun 送出的是一次樣式表 + 每則訊息的 HTML；標記只有固定的 class 外框，不會隨樣式變長
+    messages = synthetic_session()
+    user_messages = [message for message in messages if message["role"] == "user"]
+    replies = [message for message in messages if message["role"] != "user"]
+    sentence_count = sum(len(smart_sentence_split(message["content"])) for message in replies)
+    content_bytes = sum(markdown_bytes(message["content"]) for message in user_messages) + sum(
+        markdown_bytes(sentence) for message in replies for sentence in smart_sentence_split(message["content"])
+    )
+    history_bytes = sum(len(message_html(message).encode("utf-8")) for message in messages)
+
+    assert history_bytes - content_bytes == USER_BUBBLE_OVERHEAD * len(user_messages) + SENTENCE_OVERHEAD * sentence_count
+    assert len(PAGE_STYLESHEET.encode("utf-8")) + history_bytes <= 24 * 1024
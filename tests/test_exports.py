@@ -0,0 +1,29 @@
+from exports import transcript_markdown_bytes
+from test_chat_render import session_messages
+
+
+def display_name(role):
+    return {"user": "使用者", "assistant": "系統"}.get(role, role)
+
+
+def test_transcript_lists_each_round_input_after_its_replies():
+    user_inputs = {round_num: f"第 {round_num} 輪的想法" for round_num in range(3)}
+    transcript = transcript_markdown_bytes("風箏", session_messages(3), user_inputs, display_name).decode("utf-8")
+
+    assert transcript.count("## 第 ") == 3
+    for round_num in range(3):
+        heading = transcript.index(f"## 第 {round_num} 輪")
+        replies = transcript.index(f"第 {round_num} 輪的工程觀點。")
+        user_input = transcript.index(f"> 使用者輸入：第 {round_num} 輪的想法")
+        assert heading < replies < user_input
+        if round_num < 2:
+            assert user_input < transcript.index(f"## 第 {round_num + 1} 輪")
+
+
+def test_transcript_without_user_inputs_keeps_user_messages():
+    transcript = transcript_markdown_bytes("風箏", session_messages(2, in_progress=True), {}, display_name).decode("utf-8")
+
+    assert transcript.count("## 第 ") == 3
+    assert transcript.count("**使用者**") == 2
+    assert "> 使用者輸入" not in transcript
+    assert transcript.rstrip().endswith("進行中這一輪的回應。")
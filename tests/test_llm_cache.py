@@ -0,0 +1,28 @@
+import json
+
+from llm_cache import request_fingerprint
+
+
+def autogen_key(agent_name, prompt, temperature=1.0):
+    return json.dumps({
+        "model": "gpt-4o",
+        "temperature": temperature,
+        "stream": True,
+        "messages": [
+            {"role": "system", "content": "You are a helpful AI Assistant."},
+            {"role": "user", "content": prompt, "name": agent_name},
+        ],
+    })
+
+
+def test_same_prompt_from_different_sessions_shares_key():
+    prompt = "這是第 0 輪討論，風箏除了娛樂，還能用什麼其他創意用途？"
+    key_a = request_fingerprint(autogen_key("Agent_A_0f8c2d1e-1111-4a5b-9c3d-aaaaaaaaaaaa", prompt))
+    key_b = request_fingerprint(autogen_key("Agent_A_7b3e9f20-2222-4c6d-8e1f-bbbbbbbbbbbb", prompt))
+    assert key_a == key_b
+
+
+def test_different_prompt_or_temperature_changes_key():
+    base = request_fingerprint(autogen_key("Agent_A_x", "題目一"))
+    assert request_fingerprint(autogen_key("Agent_A_x", "題目二")) != base
+    assert request_fingerprint(autogen_key("Agent_A_x", "題目一", temperature=0.0)) != base
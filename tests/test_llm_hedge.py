@@ -0,0 +1,29 @@
+import asyncio
+
+from llm_hedge import hedged_call, timed_call
+
+
+def queued_primary(queue_seconds, run_seconds, result="primary"):
+    # 模擬先在 ModelLimiter 排隊 queue_seconds，取得名額後 started.set()，再花 run_seconds 回應
+    async def primary(started):
+        await asyncio.sleep(queue_seconds)
+        started.set()
+        await asyncio.sleep(run_seconds)
+        return result
+    return primary
+
+
+async def never_hedge():
+    raise AssertionError("不應該送出備援")
+
+
+def test_timed_call_excludes_queue_time():
+    content, seconds = asyncio.run(timed_call(queued_primary(0.3, 0.05)))
+    assert content == "primary"
+    assert seconds < 0.2
+
+
+def test_both_paths_measure_from_admission():
+    _, plain_seconds = asyncio.run(timed_call(queued_primary(0.3, 0.05)))
+    _, _, _, hedged_seconds = asyncio.run(hedged_call(queued_primary(0.3, 0.05), never_hedge, delay=1.0))
+    assert abs(plain_seconds - hedged_seconds) < 0.1
@@ -0,0 +1,37 @@
+import json
+
+import httpx
+
+from llm_usage import StreamUsageTap, _pop_stream_usage, _usage_of
+
+
+class ChunkedStream(httpx.SyncByteStream):
+    # 網路上每次讀到的位元組不一定剛好是完整的一行
+    def __init__(self, body, size=7):
+        self.parts = [body[i:i + size] for i in range(0, len(body), size)]
+
+    def __iter__(self):
+        yield from self.parts
+
+
+def sse(*chunks):
+    return b"".join(b"data: " + json.dumps(chunk).encode() + b"\n\n" for chunk in chunks) + b"data: [DONE]\n\n"
+
+
+def test_stream_usage_chunk_is_read_across_split_network_reads():
+    body = sse(
+        {"choices": [{"index": 0, "delta": {"content": "你好"}}]},
+        {"choices": [], "usage": {"prompt_tokens": 120, "completion_tokens": 9, "prompt_tokens_details": {"cached_tokens": 64}}},
+    )
+    tap = StreamUsageTap(ChunkedStream(body))
+    assert b"".join(tap) == body
+
+    class AutogenStreamResponse:
+        # autogen 串流時用 count_token 估的 usage，沒有 prompt_tokens_details
+        class usage:
+            prompt_tokens = 1
+            completion_tokens = 1
+            prompt_tokens_details = None
+
+    assert _usage_of(AutogenStreamResponse, _pop_stream_usage()) == {"prompt_tokens": 120, "completion_tokens": 9, "cached_tokens": 64}
+    assert _pop_stream_usage() is None
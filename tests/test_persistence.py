@@ -0,0 +1,111 @@
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from persistence import CONNECT_TIMEOUT_SECONDS, READ_TIMEOUT_SECONDS, PersistError, SupabaseConversationStore
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # 本地的 PostgREST 替身：記下每個請求，依 server.delay 延遲後回 server.status
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, body=b""):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.server.requests.append({
+            "method": self.command,
+            "path": self.path,
+            "prefer": self.headers.get("Prefer"),
+            "body": json.loads(self.rfile.read(length)) if length else None,
+        })
+        time.sleep(self.server.delay)
+        self.send_response(self.server.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self._reply()
+
+    def do_GET(self):
+        self._reply(json.dumps(self.server.rows).encode("utf-8"))
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    httpd.requests = []
+    httpd.rows = []
+    httpd.delay = 0.0
+    httpd.status = 201
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def store_for(server, **kwargs):
+    return SupabaseConversationStore(f"http://127.0.0.1:{server.server_port}", "test-key", **kwargs)
+
+
+def test_write_is_one_upsert(server):
+    record = {"session_id": "s1", "round": 2, "messages": [{"role": "user", "content": "嗨"}], "selected_ideas": []}
+    store_for(server).write(record)
+
+    assert len(server.requests) == 1
+    request = server.requests[0]
+    assert request["method"] == "POST"
+    assert request["path"] == "/rest/v1/conversations?on_conflict=session_id"
+    assert "resolution=merge-duplicates" in request["prefer"].split(",")
+    assert request["body"] == record
+
+
+def test_load_asks_for_the_latest_round_only(server):
+    server.rows = [{"round": 3, "selected_ideas": [], "messages": []}]
+    server.status = 200
+    assert store_for(server).load("s1") == server.rows[0]
+
+    assert [r["path"] for r in server.requests] == [
+        "/rest/v1/conversations?session_id=eq.s1&select=round,selected_ideas,messages&order=round.desc&limit=1"
+    ]
+
+
+def test_default_timeout_is_connect_and_read():
+    store = SupabaseConversationStore("http://127.0.0.1:9", "test-key")
+    assert store.timeout == (CONNECT_TIMEOUT_SECONDS, READ_TIMEOUT_SECONDS)
+
+
+def test_read_timeout_is_applied(server):
+    server.delay = 1.0
+    store = store_for(server, timeout=(CONNECT_TIMEOUT_SECONDS, 0.2))
+
+    start = time.perf_counter()
+    with pytest.raises(PersistError):
+        store.write({"session_id": "s1", "round": 0, "messages": []})
+    assert time.perf_counter() - start < 0.9
+    assert store.metrics.snapshot()["write"]["errors"] == 1
+
+
+def test_transport_error_is_persist_error():
+    # 找一個沒有人在聽的 port
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    store = SupabaseConversationStore(f"http://127.0.0.1:{port}", "test-key")
+
+    with pytest.raises(PersistError):
+        store.write({"session_id": "s1", "round": 0, "messages": []})
+
+
+def test_error_status_is_persist_error(server):
+    server.status = 500
+    with pytest.raises(PersistError):
+        store_for(server).write({"session_id": "s1", "round": 0, "messages": []})
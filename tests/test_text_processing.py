@@ -0,0 +1,42 @@
+import random
+
+import text_processing
+from text_benchmark import (
+    legacy_extract_ideas, legacy_smart_sentence_split, legacy_strip_emphasis, legacy_strip_markdown, synthetic_response,
+)
+
+
+def benchmark_corpus(responses=200, sections=20, seed=0):
+    # 跟 text_benchmark.py 預設的語料一樣的產生方式（數量少一點，測試跑得快）
+    rng = random.Random(seed)
+    return [synthetic_response(rng, sections) for _ in range(responses)]
+
+
+EDGE_CASES = [
+    "",
+    "   ",
+    "沒有句末標點的一句話",
+    "**整段都是粗體。裡面的句號不切！**",
+    "前面一句。**粗體。主張**後面接著寫。最後一句？",
+    "__底線強調。__ 跟 **粗體** 混在一起. English sentence! 還有問號？",
+    "**沒有結尾的粗體。後面還有句子。",
+    "✅ Idea 1: **風箏廣告** - 在海邊做空中廣告。\n✅ Idea 2: __救難標示__\n不是 Idea 的一行",
+]
+
+
+def test_smart_sentence_split_matches_legacy():
+    for text in benchmark_corpus() + EDGE_CASES:
+        assert text_processing.smart_sentence_split(text) == legacy_smart_sentence_split(text), text
+
+
+def test_extract_ideas_matches_legacy():
+    for text in benchmark_corpus() + EDGE_CASES:
+        assert text_processing.extract_ideas(text) == legacy_extract_ideas(text), text
+
+
+def test_idea_cleanup_matches_legacy():
+    ideas = [idea for text in benchmark_corpus() + EDGE_CASES for idea in legacy_extract_ideas(text)]
+    assert ideas
+    for idea in ideas:
+        assert text_processing.strip_markdown(idea) == legacy_strip_markdown(idea)
+        assert text_processing.strip_emphasis(idea) == legacy_strip_emphasis(idea)
@@ -0,0 +1,137 @@
+# text_processing 的效能基準
+# 用大量合成的 zh-TW 角色回應，跟原本的寫法（每次重新解析正規表示式、逐句逐一還原佔位字串）比較，
+# 輸出不一致或比原本的寫法慢就以非 0 結束，方便在改動後檢查有沒有退步。
+#
+#   python text_benchmark.py
+#   python text_benchmark.py --responses 2000 --repeat 5
+import argparse
+import random
+import re
+import sys
+import time
+
+import text_processing
+
+
+# 新寫法最多可以比原本慢多少（計時有雜訊，留一點餘裕）
+MAX_SLOWDOWN = 1.25
+
+
+def legacy_smart_sentence_split(text):
+    markdown_blocks = {}
+
+    def replacer(match):
+        key = f"__MARKDOWN_BLOCK_{len(markdown_blocks)}__"
+        markdown_blocks[key] = match.group(0)
+        return key
+
+    protected_text = re.sub(r'(\*\*.*?\*\*|__.*?__)', replacer, text)
+    sentences = re.split(r'(?<=[。！？.!?])', protected_text)
+    sentences = [s.strip() for s in sentences if s.strip()]
+
+    restored = []
+    for s in sentences:
+        for key, value in markdown_blocks.items():
+            s = s.replace(key, value)
+        restored.append(s)
+    return restored
+
+
+def legacy_strip_markdown(text):
+    text = re.sub(r"\*\*(.*?)\*\*", r"\1", text)
+    text = re.sub(r"\*(.*?)\*", r"\1", text)
+    text = re.sub(r"_(.*?)_", r"\1", text)
+    text = re.sub(r"!\[.*?\]\(.*?\)", "", text)
+    text = re.sub(r"\[([^\]]+)\]\([^)]+\)", r"\1", text)
+    return text.strip()
+
+
+def legacy_extract_ideas(response):
+    return re.findall(r"✅ Idea \d+: (.+)", response)
+
+
+def legacy_strip_emphasis(text):
+    return re.sub(r'(\*\*|__)(.*?)\1', r'\2', text)
+
+
+PHRASES = [
+    "我主張應結合風箏文化與節慶活動來創造品牌識別",
+    "這樣不僅能讓消費者更有情感連結",
+    "也能利用節慶集中曝光，強化市場話題性",
+    "模組化雖具彈性，但若能配合實體教學或展示活動",
+    "能幫助用戶更快上手，也更利於推廣",
+    "從工程角度來看，材料成本與耐用度需要再評估",
+    "可以參考 3D printing 的 rapid prototyping 流程",
+]
+PUNCTUATION = ["。", "！", "？", ".", "，"]
+
+
+def synthetic_response(rng, sections):
+    # 模擬角色回應：粗體主張句 + 補充說明，偶爾夾雜斜體、連結與 Idea 清單
+    parts = []
+    for i in range(1, sections + 1):
+        parts.append(f"**{i}. {rng.choice(PHRASES)}。**\n\n")
+        for _ in range(rng.randint(2, 6)):
+            phrase = rng.choice(PHRASES)
+            if rng.random() < 0.2:
+                phrase = f"*{phrase}*"
+            if rng.random() < 0.1:
+                phrase = f"[{phrase}](https://example.com)"
+            parts.append(phrase + rng.choice(PUNCTUATION))
+        parts.append("\n\n")
+    for i in range(1, rng.randint(3, 8)):
+        parts.append(f"✅ Idea {i}: __{rng.choice(PHRASES)}__ - {rng.choice(PHRASES)}。\n")
+    return "".join(parts)
+
+
+def timed_pair(legacy, current, inputs, repeat):
+    # 兩種寫法交替執行、各取最快的一次，減少機器負載變動造成的誤差
+    best = [float("inf"), float("inf")]
+    for _ in range(repeat):
+        for i, function in enumerate((legacy, current)):
+            start = time.perf_counter()
+            for text in inputs:
+                function(text)
+            best[i] = min(best[i], time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="text_processing 效能基準")
+    parser.add_argument("--responses", type=int, default=1000)
+    parser.add_argument("--sections", type=int, default=20, help="每則回應有幾段粗體主張（越多切句越吃重）")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    inputs = [synthetic_response(rng, args.sections) for _ in range(args.responses)]
+    # 去除 Markdown 實際上是對一個個 Idea 做，用解析出來的 Idea 當輸入
+    ideas = [idea for text in inputs for idea in legacy_extract_ideas(text)]
+    print(f"{len(inputs)} 則回應，共 {sum(len(t) for t in inputs) // 1024} KB；{len(ideas)} 個 Idea")
+
+    cases = [
+        ("smart_sentence_split", legacy_smart_sentence_split, text_processing.smart_sentence_split, inputs),
+        ("extract_ideas", legacy_extract_ideas, text_processing.extract_ideas, inputs),
+        ("strip_markdown", legacy_strip_markdown, text_processing.strip_markdown, ideas),
+        ("strip_emphasis", legacy_strip_emphasis, text_processing.strip_emphasis, ideas),
+    ]
+
+    failed = False
+    for name, legacy, current, case_inputs in cases:
+        if any(legacy(text) != current(text) for text in case_inputs):
+            print(f"❌ {name}：輸出跟原本的寫法不一致")
+            failed = True
+            continue
+
+        legacy_seconds, current_seconds = timed_pair(legacy, current, case_inputs, args.repeat)
+        ratio = current_seconds / legacy_seconds
+        mark = "✅" if ratio <= MAX_SLOWDOWN else "❌"
+        print(f"{mark} {name}: {legacy_seconds * 1000:.1f} ms → {current_seconds * 1000:.1f} ms（{ratio:.2f}x）")
+        failed = failed or ratio > MAX_SLOWDOWN
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
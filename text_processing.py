@@ -0,0 +1,65 @@
+# 文字處理：切句、去除 Markdown、解析 Assistant 的 Idea 清單
+# 這些函式在每次 rerun 都會對每則訊息執行，所以正規表示式都預先編譯，切句也只掃過一次文字。
+# 效能基準：python text_benchmark.py；輸出跟原本的寫法一致由 tests/test_text_processing.py 檢查
+import re
+
+
+# 粗體 / 底線強調的區塊，切句時整段視為一個單位（裡面的句號不切）
+MARKDOWN_BLOCK = re.compile(r'\*\*.*?\*\*|__.*?__')
+# 在中英文句末標點後面切開
+SENTENCE_END = re.compile(r'(?<=[。！？.!?])')
+
+# Assistant 整理的點子格式：✅ Idea 1: 內容
+IDEA_LINE = re.compile(r"✅ Idea \d+: (.+)")
+
+BOLD_OR_UNDERLINE = re.compile(r'(\*\*|__)(.*?)\1')
+MARKDOWN_BOLD = re.compile(r"\*\*(.*?)\*\*")
+MARKDOWN_ITALIC = re.compile(r"\*(.*?)\*")
+MARKDOWN_UNDERSCORE_ITALIC = re.compile(r"_(.*?)_")
+MARKDOWN_IMAGE = re.compile(r"!\[.*?\]\(.*?\)")
+MARKDOWN_LINK = re.compile(r"\[([^\]]+)\]\([^)]+\)")
+
+
+def smart_sentence_split(text: str) -> list[str]:
+    # 一次掃過：Markdown 區塊原樣接到目前這句，區塊之間的一般文字才在句末標點切開
+    # （原本是先換成佔位字串、切完再逐句逐一還原，句數 × 區塊數）
+    sentences = []
+    current = []
+
+    def add_plain(segment):
+        pieces = SENTENCE_END.split(segment)
+        current.append(pieces[0])
+        for piece in pieces[1:]:
+            sentences.append("".join(current))
+            current.clear()
+            current.append(piece)
+
+    position = 0
+    for match in MARKDOWN_BLOCK.finditer(text):
+        add_plain(text[position:match.start()])
+        current.append(match.group(0))
+        position = match.end()
+    add_plain(text[position:])
+    sentences.append("".join(current))
+
+    return [s.strip() for s in sentences if s.strip()]
+
+
+def extract_ideas(response):
+    # **解析 Assistant 產出的可選 Idea**
+    return IDEA_LINE.findall(response)
+
+
+def strip_emphasis(text):
+    # 移除粗體 / 底線強調（SCAMPER 選擇 Idea 時的選項文字）
+    return BOLD_OR_UNDERLINE.sub(r'\2', text)
+
+
+def strip_markdown(text):
+    # 去除 Markdown 標記（粗體、斜體、連結、圖片等）
+    text = MARKDOWN_BOLD.sub(r"\1", text)  # **粗體**
+    text = MARKDOWN_ITALIC.sub(r"\1", text)      # *斜體*
+    text = MARKDOWN_UNDERSCORE_ITALIC.sub(r"\1", text)        # _斜體_
+    text = MARKDOWN_IMAGE.sub("", text)   # ![圖片](url)
+    text = MARKDOWN_LINK.sub(r"\1", text)  # [文字](url)
+    return text.strip()